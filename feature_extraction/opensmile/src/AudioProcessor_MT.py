@@ -1,15 +1,33 @@
 """
 The AudioProcessor_MT.py script extracts eGeMAPS (extended Geneva Minimalistic Acoustic Parameter Set) features from MT dataset files and saves the resulting feature set to a CSV file.
+
+Several clips can be processed in one run, sharing the same OpenSmile workers:
+python3 AudioProcessor_MT.py --clips full beg mid end --workers 32
+
+With --from-video, the audio of the MP4 files is decoded in memory and passed to OpenSmile directly, instead of
+converting the videos to WAV files first (--write-wav still saves the WAV files of the converted audio).
 """
 
 
 import sys
 import os
 import glob
+import argparse
 import pandas as pd
 import json
 import opensmile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from tqdm import tqdm
+from feature_cache import FeatureCache, extract_with_cache
+from csv_writer import CategoryCsvWriter, completed_ids
+
+FEATURE_SET = opensmile.FeatureSet.eGeMAPSv02
+FEATURE_LEVEL = opensmile.FeatureLevel.Functionals
+
+# OpenSmile instance owned by the current worker process
+_smile = None
 
 
 def add_sex_feature(frequency_df):
@@ -26,31 +44,57 @@ def add_sex_feature(frequency_df):
     return frequency_df
 
 
-def create_csv_files(features, data_dir):
-    # Concat and remove columns automatically added by OpenSmile
-    all_features = pd.concat(features).reset_index()
-    all_features = all_features.drop(columns=["start", "end"])
-    # Get only the audio id from the full path of the file
-    all_features["ID"] = (
-        all_features["file"].str.split("/").str[-1].str.split(".").str[0]
-    )
-    all_features = all_features.drop(columns=["file"])
-    # Create right path for saving csv file
-    feature_dir = os.path.join(data_dir, "features")
-    csv_dir = os.path.join(feature_dir, clip, "audio")
-    os.makedirs(csv_dir, exist_ok=True)
+def format_features(features):
+    """
+    Removes the columns automatically added by OpenSmile and replaces the path
+    of the file by the audio id.
+    """
+    features = features.reset_index().drop(columns=["start", "end"])
+    features["ID"] = features["file"].str.split("/").str[-1].str.split(".").str[0]
+    return features.drop(columns=["file"])
+
+
+def get_csv_dir(data_dir, clip):
+    return os.path.join(data_dir, "features", clip, "audio")
+
+
+def get_manifest_path(data_dir, clip):
+    return os.path.join(get_csv_dir(data_dir, clip), "manifest.jsonl")
+
+
+def create_csv_files(features, audio_clips, data_dir, resume=False):
+    """
+    Writes one csv file per category and per clip. The features of each audio
+    file are appended to the csv files as soon as they are extracted, so the
+    memory used does not grow with the number of files.
+
+    Parameters:
+    features (iterable): features of each audio file, as returned by OpenSmile.
+    audio_clips (list): clip of each audio file, in the same order.
+    data_dir (str): directory of the dataset.
+    resume (bool): append to the csv files of a previous run instead of
+    overwriting them.
+    """
     # Get a dict with feature names associated with categories
     categoryDict = createFeatureLists()
-    for cat, feat in categoryDict.items():
-        current_category_feats = pd.concat(
-            [all_features["ID"], all_features[feat]], axis=1
-        )
-        # if cat == "Frequency":
-        #     current_category_feats = add_sex_feature(current_category_feats)
-        # keep_index = cat == "Frequency"
-        current_category_feats.to_csv(
-            os.path.join(csv_dir, f"{cat.title()}.csv"), index=False
-        )
+    with ExitStack() as stack:
+        writers = {}
+        for clip in dict.fromkeys(audio_clips):
+            # Create right path for saving csv file
+            csv_dir = get_csv_dir(data_dir, clip)
+            outputs = {
+                os.path.join(csv_dir, f"{cat.title()}.csv"): ["ID"] + feat
+                for cat, feat in categoryDict.items()
+            }
+            # if cat == "Frequency":
+            #     current_category_feats = add_sex_feature(current_category_feats)
+            # The manifest records the ids written, to resume an interrupted run
+            manifest_path = get_manifest_path(data_dir, clip)
+            writers[clip] = stack.enter_context(
+                CategoryCsvWriter(outputs, manifest_path, resume=resume)
+            )
+        for clip, audio_features in zip(audio_clips, features):
+            writers[clip].write(format_features(audio_features))
 
 
 def createFeatureLists():
@@ -68,7 +112,186 @@ def createFeatureLists():
     return categoryDict
 
 
-def audioProcess():
+def create_smile():
+    """
+    Creates the OpenSmile extractor used for every audio file (eGeMAPSv02
+    functionals).
+    """
+    return opensmile.Smile(feature_set=FEATURE_SET, feature_level=FEATURE_LEVEL)
+
+
+def init_worker():
+    """
+    Initializer of the worker processes: each worker builds its own OpenSmile
+    instance once, instead of once per file.
+    """
+    global _smile
+    _smile = create_smile()
+
+
+def process_file(audio):
+    return _smile.process_file(audio)
+
+
+def import_mp4_to_wav():
+    """
+    Imports the mp4_to_wav module of the wav_conversion folder, only needed
+    (with pydub) to process the videos.
+    """
+    wav_conversion_dir = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "..", "..", "wav_conversion"
+    )
+    if wav_conversion_dir not in sys.path:
+        sys.path.append(wav_conversion_dir)
+    import mp4_to_wav
+
+    return mp4_to_wav
+
+
+def process_video(source, write_wav=False):
+    """
+    Decodes the audio of a video once and extracts its features from memory.
+
+    Parameters:
+    source (tuple): path of the video and path of its .wav file, used as name
+    of the features.
+    write_wav (bool): also save the decoded audio as a .wav file, if it is not
+    up to date.
+    """
+    mp4_to_wav = import_mp4_to_wav()
+    video, wav_path = source
+    sound = mp4_to_wav.decode(video)
+    if write_wav and not mp4_to_wav.is_up_to_date(video, wav_path):
+        mp4_to_wav.export_wav(sound, wav_path)
+    return _smile.process_signal(
+        mp4_to_wav.to_signal(sound), sound.frame_rate, file=wav_path
+    )
+
+
+def extract_features(sources, workers=1, chunksize=8, process=process_file):
+    """
+    Extracts the features of every audio file, serially or with a pool of
+    worker processes.
+
+    Parameters:
+    sources (list): paths of the .wav files (or sources given to process).
+    workers (int): number of worker processes, 1 runs in the current process.
+    chunksize (int): number of files handed to a worker at once.
+    process (function): extracts the features of one source.
+
+    Yields:
+    features (DataFrame): features of each file, in the order of sources.
+    """
+    if workers <= 1:
+        init_worker()
+        for source in tqdm(sources):
+            yield process(source)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        # map() yields the results in input order, so the csv files are the
+        # same as with a serial run
+        results = pool.map(process, sources, chunksize=chunksize)
+        yield from tqdm(results, total=len(sources))
+
+
+def open_cache(data_dir, rebuild=False):
+    """
+    Opens the feature cache of the dataset, stored with the csv files.
+    If rebuild is True, the cache is emptied and filled again by the run.
+    """
+    cache_path = os.path.join(data_dir, "features", "opensmile_cache.sqlite")
+    cache = FeatureCache(cache_path, FEATURE_SET.name, FEATURE_LEVEL.name)
+    if rebuild:
+        cache.clear()
+    return cache
+
+
+def remove_completed(data_dir, clip, paths):
+    """
+    Leaves out the files whose id was already written by a previous run.
+    """
+    done = completed_ids(get_manifest_path(data_dir, clip))
+    print(f"Resuming {clip}: {len(done)} files already written")
+    return [path for path in paths if os.path.basename(path).split(".")[0] not in done]
+
+
+def find_audio_paths(data_dir, clips, resume=False):
+    """
+    Lists the .wav files of every clip.
+
+    Parameters:
+    data_dir (str): directory of the dataset.
+    clips (list): names of the clips (full, beg, mid, end).
+    resume (bool): leave out the ids already written by a previous run.
+
+    Returns:
+    audio_clips (list): clip of each audio file.
+    audio_paths (list): paths of the audio files.
+    """
+    audio_dir = os.path.join(data_dir, "wav")
+    audio_clips = []
+    audio_paths = []
+    for clip in clips:
+        clip_paths = glob.glob(f"{audio_dir}/{clip}/*.wav")
+        if resume:
+            clip_paths = remove_completed(data_dir, clip, clip_paths)
+        audio_clips += [clip] * len(clip_paths)
+        audio_paths += clip_paths
+    return audio_clips, audio_paths
+
+
+def find_video_paths(data_dir, clips, resume=False):
+    """
+    Lists the .mp4 files of every clip, with the path of the .wav file they are
+    converted to by mp4_to_wav.py.
+
+    Parameters:
+    data_dir (str): directory of the dataset, with the mp4 subfolder and the
+    transcripts_ID_list_modif.csv table.
+    clips (list): names of the clips (full, beg, mid, end).
+    resume (bool): leave out the ids already written by a previous run.
+
+    Returns:
+    audio_clips (list): clip of each video.
+    video_paths (list): paths of the videos.
+    wav_paths (list): paths of the .wav files of the videos.
+    """
+    mp4_to_wav = import_mp4_to_wav()
+    wav_dir = os.path.join(data_dir, "wav") + "/"
+    ids = mp4_to_wav.prepare_ids(
+        pd.read_csv(os.path.join(data_dir, "transcripts_ID_list_modif.csv"), sep=";")
+    )
+    wav_of_video = {}
+    for video in glob.glob(f"{data_dir}/mp4/*/*/*.mp4"):
+        wav_path = mp4_to_wav.find_right_name(video, wav_dir, ids)
+        if wav_path is not None:
+            wav_of_video[video] = wav_path
+    audio_clips = []
+    video_paths = []
+    wav_paths = []
+    for clip in clips:
+        clip_paths = [
+            wav for wav in wav_of_video.values() if wav.split("/")[-2] == clip
+        ]
+        if resume:
+            clip_paths = set(remove_completed(data_dir, clip, clip_paths))
+        for video, wav_path in wav_of_video.items():
+            if wav_path in clip_paths:
+                audio_clips.append(clip)
+                video_paths.append(video)
+                wav_paths.append(wav_path)
+    return audio_clips, video_paths, wav_paths
+
+
+def audioProcess(
+    clips,
+    workers=1,
+    use_cache=True,
+    rebuild_cache=False,
+    resume=False,
+    from_video=False,
+    write_wav=False,
+):
     """
     Main function that reads .wav files from the directory with the audios and
     executes feature extraction. Audio directory should contain subfolders:
@@ -78,6 +301,15 @@ def audioProcess():
     Parameters:
     rootDirPATH: str: root directory
     dataset: name of the dataset
+    clips (list): subfolders to process, the files of all the clips go
+    through the same workers
+    workers (int): number of worker processes used for the extraction
+    use_cache (bool): reuse the features of the files already processed
+    rebuild_cache (bool): empty the cache before the extraction
+    resume (bool): skip the ids already written by a previous run
+    from_video (bool): decode the audio of the videos in memory instead of
+    reading the .wav files
+    write_wav (bool): with from_video, also save the .wav files
 
     Returns: features (DataFrame): array of N x nb_cat_feat dimensions where:
             n -- nb of data samples
@@ -86,21 +318,66 @@ def audioProcess():
     """
     # Find the audio paths based on the list of clips for the analysis
     data_dir = os.path.join(rootDirPath, "data", dataset)
-    audio_dir = os.path.join(data_dir, "wav")
-    audio_paths = glob.glob(f"{audio_dir}/{clip}/*.wav")
-    # Initialize OpenSmile
-    smile = opensmile.Smile(
-        feature_set=opensmile.FeatureSet.eGeMAPSv02,
-        feature_level=opensmile.FeatureLevel.Functionals,
-    )
-    features = []
-    # Extract features with opensmile for every file and append to the list
-    for audio in tqdm(audio_paths):
-        features.append(smile.process_file(audio))
-    create_csv_files(features, data_dir)
+    stale = set()
+    if from_video:
+        mp4_to_wav = import_mp4_to_wav()
+        audio_clips, audio_paths, names = find_video_paths(data_dir, clips, resume)
+        wav_of_video = dict(zip(audio_paths, names))
+        if write_wav:
+            for part in mp4_to_wav.PARTS:
+                os.makedirs(os.path.join(data_dir, "wav", part), exist_ok=True)
+            # the videos without an up to date .wav file are decoded even if
+            # their features are cached
+            stale = {
+                video
+                for video, wav_path in wav_of_video.items()
+                if not mp4_to_wav.is_up_to_date(video, wav_path)
+            }
+
+        def extract(video_paths):
+            sources = [(video, wav_of_video[video]) for video in video_paths]
+            process = partial(process_video, write_wav=write_wav)
+            return extract_features(sources, workers=workers, process=process)
+
+    else:
+        audio_clips, audio_paths = find_audio_paths(data_dir, clips, resume=resume)
+        names = None
+        extract = partial(extract_features, workers=workers)
+    # Extract features with opensmile for every file not in the cache
+    if use_cache:
+        with open_cache(data_dir, rebuild=rebuild_cache) as cache:
+            features = extract_with_cache(audio_paths, extract, cache, names, stale)
+            create_csv_files(features, audio_clips, data_dir, resume=resume)
+    else:
+        features = extract(audio_paths)
+        create_csv_files(features, audio_clips, data_dir, resume=resume)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-c", "--clips", nargs="+", help="clips to process (default: clip of the config)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="extract every file again"
+    )
+    parser.add_argument(
+        "--rebuild-cache", action="store_true", help="empty the feature cache first"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="skip the files of an interrupted run"
+    )
+    parser.add_argument(
+        "--from-video", action="store_true", help="decode the mp4 files in memory"
+    )
+    parser.add_argument(
+        "--write-wav", action="store_true", help="with --from-video, save the wav files"
+    )
+    args = parser.parse_args()
+
     current = os.path.dirname(os.path.realpath(__file__))
     parent = os.path.dirname(current)
     sys.path.append(parent)
@@ -111,12 +388,20 @@ if __name__ == "__main__":
     # Use the configuration values
     rootDirPath = config["rootDirPath"]
     dataset = config["dataset"]
-    clip = config["clip"]
+    clips = args.clips if args.clips else [config["clip"]]
 
     # Example usage in your script
     print(f"Root Directory Path: {rootDirPath}")
     print(f"Dataset: {dataset}")
-    print(f"Clip: {clip}")
+    print(f"Clips: {', '.join(clips)}")
 
     sys.path.append(rootDirPath)
-    audioProcess()
+    audioProcess(
+        clips,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        rebuild_cache=args.rebuild_cache,
+        resume=args.resume,
+        from_video=args.from_video,
+        write_wav=args.write_wav,
+    )
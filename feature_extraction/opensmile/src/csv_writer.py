@@ -0,0 +1,135 @@
+"""
+The csv_writer.py module writes the extracted features to csv files while the extraction is running, instead of
+concatenating the features of the whole corpus in memory first.
+
+The rows of each audio file are appended to every csv file as soon as they are extracted, and a manifest records
+the IDs written so far (JSON lines with the hash of the rows written, the time and the size of the csv files).
+If the process is killed, the csv files contain every ID of the manifest and the manifest has no "complete" line:
+running again with resume=True truncates the csv files to the last ID of the manifest and appends the new rows.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+def read_manifest(manifest_path):
+    """
+    Reads the entries of a manifest, an empty list if it does not exist.
+    """
+    if not os.path.exists(manifest_path):
+        return []
+    entries = []
+    with open(manifest_path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # last line cut by a crash
+                break
+    return entries
+
+
+def completed_ids(manifest_path):
+    """
+    Returns the set of IDs already written according to a manifest.
+    """
+    return {entry["id"] for entry in read_manifest(manifest_path) if "id" in entry}
+
+
+class CategoryCsvWriter:
+    """
+    Appends rows of features to several csv files, one per category.
+
+    Parameters:
+        outputs (dict): csv paths as keys and lists of columns to write as
+            values (None to write every column).
+        manifest_path (str): path of the manifest of the IDs written.
+        id_column (str): name of the column with the ID of the audio.
+        index (bool): write a running row number as first column, as
+            DataFrame.to_csv does with a default index.
+        resume (bool): keep the rows of the IDs in the manifest and append the
+            new ones, instead of starting new csv files. A ValueError is raised
+            if a csv file is missing or not recorded in the manifest.
+    """
+
+    def __init__(self, outputs, manifest_path, id_column="ID", index=False, resume=False):
+        self.outputs = outputs
+        self.manifest_path = manifest_path
+        self.id_column = id_column
+        self.index = index
+        self.count = 0
+        offsets = {}
+        entries = [entry for entry in read_manifest(manifest_path) if "id" in entry]
+        if resume and entries:
+            self.count = entries[-1]["rows"]
+            offsets = entries[-1]["offsets"]
+            for path in outputs:
+                if os.path.basename(path) not in offsets or not os.path.exists(path):
+                    raise ValueError(
+                        f"cannot resume: {path} is not recorded in {manifest_path} or is missing"
+                    )
+        self.files = {}
+        for path in outputs:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            name = os.path.basename(path)
+            if name in offsets:
+                # drop the rows written after the last entry of the manifest
+                os.truncate(path, offsets[name])
+                self.files[path] = open(path, "a", newline="", encoding="utf-8")
+            else:
+                self.files[path] = open(path, "w", newline="", encoding="utf-8")
+        if offsets:
+            # rewrite the manifest without a possibly cut last line
+            with open(manifest_path, "w", encoding="utf-8") as manifest:
+                for entry in entries:
+                    manifest.write(json.dumps(entry) + "\n")
+            self.manifest = open(manifest_path, "a", encoding="utf-8")
+        else:
+            self.manifest = open(manifest_path, "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(complete=exc_type is None)
+
+    def write(self, rows):
+        """
+        Appends the rows of one audio file to every csv file and records its ID
+        in the manifest.
+
+        Parameters:
+        rows (DataFrame): features of the audio file.
+        """
+        if self.index:
+            rows.index = range(self.count, self.count + len(rows))
+        digest = hashlib.sha256()
+        for path, columns in self.outputs.items():
+            selection = rows if columns is None else rows[columns]
+            text = selection.to_csv(header=self.count == 0, index=self.index)
+            self.files[path].write(text)
+            self.files[path].flush()
+            digest.update(text.encode("utf-8"))
+        self.count += len(rows)
+        # The ID is only recorded once every csv file contains its rows
+        entry = {
+            "id": str(rows[self.id_column].iloc[0]),
+            "hash": digest.hexdigest(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "rows": self.count,
+            "offsets": {
+                os.path.basename(path): f.tell() for path, f in self.files.items()
+            },
+        }
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.manifest.flush()
+
+    def close(self, complete=True):
+        for f in self.files.values():
+            f.close()
+        if complete:
+            time = datetime.now().isoformat(timespec="seconds")
+            self.manifest.write(json.dumps({"complete": True, "time": time}) + "\n")
+        self.manifest.close()
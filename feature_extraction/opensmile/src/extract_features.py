@@ -8,48 +8,107 @@ It requires a "wav" subdirectory in the directory.
 
 Also possible to perform the creation of several csv depending on the categories defined in the 'categories.py' file. To do so, run with the same command as before but add a third argument, for example:
 python3 extract_features.py /path/to/corpus_dir -c
+
+The features of each file are cached in /path/to/corpus_dir/features_cache.sqlite, so that only new or modified
+audio files are processed again. Use --no-cache to extract every file, or --rebuild-cache to empty the cache first.
+The IDs written are recorded in features_full.manifest.jsonl (features_full_categories.manifest.jsonl with -c):
+--resume continues an interrupted run.
 """
 
 
-import sys
+import os
 import opensmile
 import glob
-import pandas as pd
+import argparse
 from categories import CATEGORIES
+from feature_cache import FeatureCache, extract_with_cache
+from csv_writer import CategoryCsvWriter, completed_ids
 
-
-def split_feature_categories(features):
-    for cat, feat in CATEGORIES.items():
-        only_category = pd.concat([features["file"], features[feat]], axis=1)
-        only_category.to_csv(f"features_full_{cat}.csv")
+FEATURE_SET = opensmile.FeatureSet.eGeMAPSv02
+FEATURE_LEVEL = opensmile.FeatureLevel.Functionals
 
 
-def create_csv(features, to_split=False):
-    all_features = pd.concat(features).reset_index()
-    all_features = all_features.drop(columns=["start", "end"])
-    all_features["file"] = (
-        all_features["file"].str.split("/").str[-1].str.split(".").str[0]
-    )
-    print(all_features)
+def get_manifest_path(to_split=False):
+    """
+    Returns the path of the manifest of the csv files written, one per set of outputs so that
+    --resume never mixes the IDs of features_full.csv with those of the category csv files.
+    """
     if to_split:
-        return split_feature_categories(all_features)
-    all_features.to_csv("features_full.csv")
+        return "features_full_categories.manifest.jsonl"
+    return "features_full.manifest.jsonl"
 
 
-def main():
-    if len(sys.argv) < 2:
-        sys.exit("Usage: python3 extract_features.py /path/to/corpus_dir")
-    audio_paths = glob.glob(f"{sys.argv[1]}/wav/full/*.wav")
-    smile = opensmile.Smile(
-        feature_set=opensmile.FeatureSet.eGeMAPSv02,
-        feature_level=opensmile.FeatureLevel.Functionals,
-    )
-    features = []
+def split_feature_categories():
+    return {
+        f"features_full_{cat}.csv": ["file"] + feat for cat, feat in CATEGORIES.items()
+    }
+
+
+def create_csv(features, to_split=False, resume=False):
+    """
+    Writes the features to csv, appending the rows of each audio file as soon
+    as it is extracted.
+    """
+    outputs = split_feature_categories() if to_split else {"features_full.csv": None}
+    with CategoryCsvWriter(
+        outputs, get_manifest_path(to_split), id_column="file", index=True, resume=resume
+    ) as writer:
+        for audio_features in features:
+            audio_features = audio_features.reset_index()
+            audio_features = audio_features.drop(columns=["start", "end"])
+            audio_features["file"] = (
+                audio_features["file"].str.split("/").str[-1].str.split(".").str[0]
+            )
+            writer.write(audio_features)
+    print(f"{writer.count} files written")
+
+
+def extract(audio_paths):
+    smile = opensmile.Smile(feature_set=FEATURE_SET, feature_level=FEATURE_LEVEL)
     for audio in audio_paths:
-        features.append(smile.process_file(audio))
-    to_split = len(sys.argv) > 2
-    create_csv(features, to_split=to_split)
+        yield smile.process_file(audio)
+
+
+def main(corpus_dir, to_split=False, use_cache=True, rebuild_cache=False, resume=False):
+    audio_paths = glob.glob(f"{corpus_dir}/wav/full/*.wav")
+    if resume:
+        done = completed_ids(get_manifest_path(to_split))
+        audio_paths = [
+            audio
+            for audio in audio_paths
+            if os.path.basename(audio).split(".")[0] not in done
+        ]
+    if use_cache:
+        cache_path = os.path.join(corpus_dir, "features_cache.sqlite")
+        with FeatureCache(cache_path, FEATURE_SET.name, FEATURE_LEVEL.name) as cache:
+            if rebuild_cache:
+                cache.clear()
+            features = extract_with_cache(audio_paths, extract, cache)
+            create_csv(features, to_split, resume)
+    else:
+        create_csv(extract(audio_paths), to_split, resume)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir")
+    parser.add_argument(
+        "-c", "--categories", action="store_true", help="one csv per category"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="extract every file again"
+    )
+    parser.add_argument(
+        "--rebuild-cache", action="store_true", help="empty the feature cache first"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="skip the files of an interrupted run"
+    )
+    args = parser.parse_args()
+    main(
+        args.corpus_dir,
+        to_split=args.categories,
+        use_cache=not args.no_cache,
+        rebuild_cache=args.rebuild_cache,
+        resume=args.resume,
+    )
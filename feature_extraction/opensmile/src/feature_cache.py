@@ -0,0 +1,209 @@
+"""
+The feature_cache.py module stores the OpenSmile features of each audio file on disk, so that a new run of the
+extraction scripts only processes the audio files that were added or modified since the last one.
+
+The cache is a single SQLite file. The features of a file are keyed by the hash of the content of the file, the
+feature set and the feature level: renaming or moving a file does not invalidate its features, but changing its
+content or the OpenSmile configuration does.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """
+    Computes the sha256 hash of the content of a file.
+
+    Parameters:
+    path (str): path of the file.
+
+    Returns:
+    str: hexadecimal digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    On-disk cache of the OpenSmile features, one DataFrame per audio file.
+
+    Parameters:
+        path (str): path of the SQLite file.
+        feature_set (str): name of the OpenSmile feature set (e.g. eGeMAPSv02).
+        feature_level (str): name of the OpenSmile feature level (e.g. Functionals).
+        max_size (int): maximum size of the stored features in bytes, the least
+            recently used entries are evicted above it.
+    """
+
+    def __init__(self, path, feature_set, feature_level, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.feature_set = feature_set
+        self.feature_level = feature_level
+        self.max_size = max_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS features (
+                digest TEXT,
+                feature_set TEXT,
+                feature_level TEXT,
+                data BLOB,
+                size INTEGER,
+                last_access REAL,
+                PRIMARY KEY (digest, feature_set, feature_level)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                size INTEGER,
+                digest TEXT
+            );
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def digest(self, audio):
+        """
+        Returns the content hash of an audio file. The hash is only recomputed
+        when the size or the modification time of the file changed.
+        """
+        stat = os.stat(audio)
+        row = self.connection.execute(
+            "SELECT mtime_ns, size, digest FROM files WHERE path = ?", (audio,)
+        ).fetchone()
+        if row is not None and row[:2] == (stat.st_mtime_ns, stat.st_size):
+            return row[2]
+        digest = file_digest(audio)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (audio, stat.st_mtime_ns, stat.st_size, digest),
+        )
+        return digest
+
+    def contains(self, audio):
+        row = self.connection.execute(
+            "SELECT 1 FROM features WHERE digest = ? AND feature_set = ? AND feature_level = ?",
+            (self.digest(audio), self.feature_set, self.feature_level),
+        ).fetchone()
+        return row is not None
+
+    def get(self, audio, name=None):
+        """
+        Returns the cached features of an audio file, or None if the file was
+        never processed with this configuration. The file of the features is
+        set to name, the path of the audio file by default.
+        """
+        key = (self.digest(audio), self.feature_set, self.feature_level)
+        row = self.connection.execute(
+            "SELECT data FROM features WHERE digest = ? AND feature_set = ? AND feature_level = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            "UPDATE features SET last_access = ? WHERE digest = ? AND feature_set = ? AND feature_level = ?",
+            (time.time(), *key),
+        )
+        features = pickle.loads(row[0])
+        # The same content may have been cached under another path
+        features.index = features.index.set_levels([name or audio], level="file")
+        return features
+
+    def put(self, audio, features):
+        data = pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                self.digest(audio),
+                self.feature_set,
+                self.feature_level,
+                data,
+                len(data),
+                time.time(),
+            ),
+        )
+        # Commit right away so that an interrupted run keeps its features
+        self.connection.commit()
+
+    def clear(self):
+        self.connection.execute("DELETE FROM features")
+        self.connection.execute("DELETE FROM files")
+
+    def evict(self):
+        """
+        Removes the least recently used features until the cache fits in
+        max_size.
+        """
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM features"
+        ).fetchone()[0]
+        rows = self.connection.execute(
+            "SELECT digest, feature_set, feature_level, size FROM features ORDER BY last_access"
+        ).fetchall()
+        for digest, feature_set, feature_level, size in rows:
+            if total <= self.max_size:
+                break
+            self.connection.execute(
+                "DELETE FROM features WHERE digest = ? AND feature_set = ? AND feature_level = ?",
+                (digest, feature_set, feature_level),
+            )
+            total -= size
+        self.connection.commit()
+
+
+def extract_with_cache(audio_paths, extract, cache=None, names=None, stale=()):
+    """
+    Yields the features of every audio file, extracting only the files that
+    are not in the cache.
+
+    Parameters:
+    audio_paths (list): paths of the audio files.
+    extract (function): takes a list of paths and returns an iterable of their
+        features, in the same order.
+    cache (FeatureCache): cache to use, None to extract every file.
+    names (list): file names given to the cached features, if they were not
+        extracted from audio_paths directly (e.g. from videos).
+    stale (set): paths extracted again even if they are in the cache (e.g.
+        videos whose .wav file must be written).
+
+    Yields:
+    features (DataFrame): features of each file, in the order of audio_paths.
+    """
+    if cache is None:
+        yield from extract(audio_paths)
+        return
+    missing = [
+        audio for audio in audio_paths if audio in stale or not cache.contains(audio)
+    ]
+    print(f"{len(audio_paths) - len(missing)} files found in cache, {len(missing)} to extract")
+    extracted = iter(extract(missing))
+    missing = set(missing)
+    for audio, name in zip(audio_paths, names or audio_paths):
+        if audio in missing:
+            features = next(extracted)
+            cache.put(audio, features)
+        else:
+            features = cache.get(audio, name)
+        yield features
+    cache.evict()
@@ -2,20 +2,35 @@
 This script converts MP4 video files to WAV audio files. It processes all MP4 files in a specified directory and saves the converted WAV files to a destination directory.
 
 To run this script:
-python3 mp4_to_wav.py /path/to/video_dir
+python3 mp4_to_wav.py /path/to/video_dir [--workers N] [--backend ffmpeg] [--sample-rate 16000] [--channels 1]
 
 /path/to/video_dir: The path to the directory containing the MP4 files to be converted. The script expects the MP4 files to be located in a subdirectory named mp4 within this directory. The converted WAV files will be saved in a subdirectory named wav.
 
-pydub library is required.
+The videos are converted by N worker processes (1 by default). WAV files that are newer than their video, not
+empty and, with --sample-rate or --channels, already at that rate and number of channels are considered up to date
+and are not converted again.
+
+pydub library is required. With --backend ffmpeg, the ffmpeg executable decodes each video straight into the WAV
+file, so the decoded track is never held in memory. --sample-rate and --channels resample the audio at decode time
+(e.g. 16 kHz mono for Whisper and OpenSmile), otherwise the audio of the video is kept as is.
+
+The decoded audio can also be passed directly to OpenSmile with to_signal(), without writing the WAV files first
+(see the --from-video mode of AudioProcessor_MT.py).
 """
 
-import sys
 import os
 import glob
+import wave
+import argparse
+import subprocess
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pydub import AudioSegment
 
 PARTS = ["beg", "end", "mid", "full"]
+BACKENDS = ["pydub", "ffmpeg"]
 ACCENTS = {
     "è": "e",
     "é": "e",
@@ -28,7 +43,7 @@ ACCENTS = {
 }
 
 
-def find_right_name(filepath, dest_path, df_ids):
+def find_right_name(filepath, dest_path, ids):
     filename = filepath.split("/")[-1]
     filepart = filepath.split("/")[-2]
     for accent, no_accent in ACCENTS.items():
@@ -40,43 +55,201 @@ def find_right_name(filepath, dest_path, df_ids):
         if filepath.split("/")[-2].startswith(part):
             dest_path += f"{part}/"
     try:
-        name_path = df_ids.query("`Name` == @filename")["subname"].values[0]
-    except IndexError:
+        name_path = ids[filename]
+    except KeyError:
         print(f"\nERROR: {filename} not found.\n")
         return None
     dest_path += name_path
     return dest_path + ".wav"
 
 
-def save_as_wav_files(video_paths, dest_path, df_ids):
+def prepare_ids(df_ids):
+    """
+    Creates the lookup table from the name of a video file to its ID.
+
+    Parameters:
+    df_ids (pd.DataFrame): table with the Name of the transcripts and their
+    subname (ID).
+
+    Returns:
+    dict: ID of each video file name (first one if a name is repeated).
+    """
+    df_ids = df_ids.rename(str.lower, axis="columns")
+    names = df_ids["name"].str.replace("_transcript.txt", ".mp4")
+    first = ~names.duplicated()
+    return dict(zip(names[first], df_ids["subname"][first]))
+
+
+def decode(filepath):
+    return AudioSegment.from_file(filepath, format="mp4")
+
+
+def to_signal(sound):
+    """
+    Converts decoded audio to a float32 array of shape (channels, samples) with
+    values in [-1, 1], as audio libraries read them from a WAV file.
+
+    Parameters:
+    sound (AudioSegment): decoded audio.
+
+    Returns:
+    np.ndarray: the signal.
+    """
+    samples = np.array(sound.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, sound.channels).T
+    return samples / float(1 << (8 * sound.sample_width - 1))
+
+
+def is_up_to_date(filepath, name, sample_rate=None, channels=None):
+    """
+    Checks if the WAV file of a video exists, is not empty, is more recent
+    than the video and has the requested sample rate and number of channels
+    (read from its header, None accepts any).
+    """
+    try:
+        wav_stat = os.stat(name)
+    except FileNotFoundError:
+        return False
+    if wav_stat.st_size == 0 or wav_stat.st_mtime < os.stat(filepath).st_mtime:
+        return False
+    if sample_rate is None and channels is None:
+        return True
+    try:
+        with wave.open(name, "rb") as wav:
+            rate, n_channels = wav.getframerate(), wav.getnchannels()
+    except (wave.Error, EOFError):
+        return False
+    return (sample_rate is None or rate == sample_rate) and (
+        channels is None or n_channels == channels
+    )
+
+
+def export_wav(sound, name):
+    """
+    Saves decoded audio as a WAV file, through a temporary file renamed to the
+    WAV file once it is complete.
+    """
+    tmp_name = f"{name}.tmp"
+    try:
+        sound.export(tmp_name, format="wav")
+        os.replace(tmp_name, name)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def convert_with_ffmpeg(filepath, name, sample_rate=None, channels=None):
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", filepath]
+    command += ["-vn", "-acodec", "pcm_s16le"]
+    if sample_rate is not None:
+        command += ["-ar", str(sample_rate)]
+    if channels is not None:
+        command += ["-ac", str(channels)]
+    # the extension of a temporary file does not tell ffmpeg the format
+    subprocess.run(command + ["-f", "wav", name], check=True)
+
+
+def convert(filepath, name, backend="pydub", sample_rate=None, channels=None):
+    """
+    Converts the audio of a video to a WAV file.
+
+    Parameters:
+    filepath (str): path of the video.
+    name (str): path of the WAV file.
+    backend (str): "pydub" decodes the whole audio in memory before exporting
+    it, "ffmpeg" streams it from the video to the WAV file.
+    sample_rate (int): sample rate of the WAV file, None to keep the original.
+    channels (int): number of channels of the WAV file, None to keep the
+    original.
+
+    Returns:
+    str: path of the WAV file.
+
+    The audio is written to a temporary file renamed to the WAV file once it is
+    complete, so that an interrupted conversion never leaves a truncated WAV file
+    that would be taken as up to date.
+    """
+    if backend == "pydub":
+        sound = decode(filepath)
+        if sample_rate is not None:
+            sound = sound.set_frame_rate(sample_rate)
+        if channels is not None:
+            sound = sound.set_channels(channels)
+        export_wav(sound, name)
+        return name
+    tmp_name = f"{name}.tmp"
+    try:
+        convert_with_ffmpeg(filepath, tmp_name, sample_rate, channels)
+        os.replace(tmp_name, name)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+    return name
+
+
+def save_as_wav_files(
+    video_paths,
+    dest_path,
+    df_ids,
+    workers=1,
+    backend="pydub",
+    sample_rate=None,
+    channels=None,
+):
     os.makedirs(dest_path, exist_ok=True)
     for part in PARTS:
         os.makedirs(dest_path + part, exist_ok=True)
-    df_ids = pd.concat(
-        [
-            df_ids.rename(str.lower, axis="columns"),
-            df_ids["Name"].str.replace("_transcript.txt", ".mp4"),
-        ],
-        axis=1,
-    )
+    ids = prepare_ids(df_ids)
+    conversions = []
     for filepath in video_paths:
-        name = find_right_name(filepath, dest_path, df_ids)
-        if name is None:
+        name = find_right_name(filepath, dest_path, ids)
+        if name is None or is_up_to_date(filepath, name, sample_rate, channels):
             continue
-        print(name, end="\n")
-        # name = filepath.split("/")[-1].split(".")[0]
-        sound = AudioSegment.from_file(filepath, format="mp4")
-        sound.export(name, format="wav")
+        conversions.append((filepath, name))
+    print(f"{len(conversions)} videos to convert")
+    convert_video = partial(
+        convert, backend=backend, sample_rate=sample_rate, channels=channels
+    )
+    if workers <= 1:
+        for filepath, name in conversions:
+            print(convert_video(filepath, name), end="\n")
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        filepaths = [filepath for filepath, _ in conversions]
+        names = [name for _, name in conversions]
+        for name in pool.map(convert_video, filepaths, names):
+            print(name, end="\n")
 
 
-def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python3 mp4_to_wav.py /path/do/video_dir")
-    id_path = f"{sys.argv[1]}/transcripts_ID_list_modif.csv"
-    video_paths = glob.glob(f"{sys.argv[1]}/mp4/*/*/*.mp4")
+def main(video_dir, workers=1, backend="pydub", sample_rate=None, channels=None):
+    id_path = f"{video_dir}/transcripts_ID_list_modif.csv"
+    video_paths = glob.glob(f"{video_dir}/mp4/*/*/*.mp4")
     df_ids = pd.read_csv(id_path, sep=";")
-    save_as_wav_files(video_paths, f"{sys.argv[1]}/wav/", df_ids)
+    save_as_wav_files(
+        video_paths,
+        f"{video_dir}/wav/",
+        df_ids,
+        workers=workers,
+        backend=backend,
+        sample_rate=sample_rate,
+        channels=channels,
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video_dir")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="pydub")
+    parser.add_argument("-r", "--sample-rate", type=int, help="e.g. 16000")
+    parser.add_argument("-c", "--channels", type=int, help="e.g. 1 for mono")
+    args = parser.parse_args()
+    main(
+        args.video_dir,
+        workers=args.workers,
+        backend=args.backend,
+        sample_rate=args.sample_rate,
+        channels=args.channels,
+    )
@@ -1,38 +1,60 @@
 import pandas as pd
 import glob
 import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 
-def add_line(feature_csv, profile_path):
+def read_profile(profile_path):
     """
-    Adds a new line of data from a TSV file to the feature_csv DataFrame and appends an ID column.
+    Reads the data of a TSV file and appends an ID column.
 
     Parameters:
-    - feature_csv (pd.DataFrame): The DataFrame to which the new line will be added.
     - profile_path (str): The file path of the TSV file to be read.
 
     Returns:
-    - pd.DataFrame: The updated DataFrame with the new line and ID column appended.
+    - pd.DataFrame: The data of the profile with the ID column appended.
     """
     profile_id = os.path.basename(profile_path).replace(".txt", "").split("_")[0]
     profile_data = pd.read_csv(profile_path, sep="\t")
     profile_data["ID"] = profile_id
-    return pd.concat([feature_csv, profile_data], ignore_index=True)
+    return profile_data
 
 
-def main():
+def save_columnar(feature_csv, columnar_format):
+    """
+    Saves the combined features next to combined_features.csv in a columnar format.
+
+    Parameters:
+    - feature_csv (pd.DataFrame): The combined features, indexed by ID.
+    - columnar_format (str): "parquet" or "feather" (both require pyarrow).
+    """
+    if columnar_format == "parquet":
+        feature_csv.to_parquet("combined_features.parquet")
+    elif columnar_format == "feather":
+        # feather files do not store a custom index
+        feature_csv.reset_index().to_feather("combined_features.feather")
+
+
+def main(workers=8, columnar_format=None):
     """
     Main function that processes all TSV files in the 'prosodic_profiles' directory,
     concatenates them into a single DataFrame, adds an ID column, and saves the result as a CSV file.
+
+    Parameters:
+    - workers (int): The number of threads reading the TSV files.
+    - columnar_format (str): Also save the result as "parquet" or "feather" if given.
     """
     profiles = glob.glob("prosodic_profiles/*.txt")
-    feature_csv = pd.DataFrame()
-
-    for profile in profiles:
-        feature_csv = add_line(feature_csv, profile)
+    # The files are read in parallel and concatenated once, in the order of the glob
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        profile_data = list(pool.map(read_profile, profiles))
+    feature_csv = pd.concat(profile_data, ignore_index=True)
 
     feature_csv.set_index("ID", inplace=True)
     feature_csv.to_csv("combined_features.csv")
+    if columnar_format is not None:
+        save_columnar(feature_csv, columnar_format)
     print(feature_csv)
 
 
@@ -40,4 +62,12 @@ if __name__ == "__main__":
     """
     Entry point of the script. It calls the main function to execute the processing of TSV files.
     """
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-w", "--workers", type=int, default=8, help="number of reading threads"
+    )
+    parser.add_argument(
+        "-f", "--format", choices=["parquet", "feather"], help="also save in this format"
+    )
+    args = parser.parse_args()
+    main(workers=args.workers, columnar_format=args.format)
@@ -1,7 +1,9 @@
 import os
-import sys
 import glob
 import json
+import argparse
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 import parselmouth as pm
 import textgrids as tgt
 
@@ -36,65 +38,70 @@ class Word:
             "index": self.tgt_index,
         }
 
-def already_stored(word_text, word_list):
+def build_word_index(words):
     """
-    Checks if a word is already in the list of words.
+    Builds the sorted start and end times of the words, used to find the word
+    containing a time interval by binary search.
 
     Args:
-        word_text (str): The text of the word to check.
-        word_list (list): The list of Word objects.
+        words (list): List of word intervals from TextGrid, sorted by time.
 
     Returns:
-        bool: True if the word is already in the list, False otherwise.
+        tuple: Lists of the start times and of the end times of the words.
     """
-    for word in word_list:
-        if word.word == word_text:
-            return True
-    return False
+    return [word.xmin for word in words], [word.xmax for word in words]
 
-def find_words_in_intervals(time_intervals, words):
+def find_words_in_intervals(time_intervals, words, word_index=None):
     """
     Finds words within specified time intervals.
 
     Args:
         time_intervals (list): List of tuples containing start and end times.
         words (list): List of word intervals from TextGrid.
+        word_index (tuple): Index returned by build_word_index, built if None.
 
     Returns:
         list: List of Word objects found within the specified time intervals.
     """
+    starts, ends = word_index or build_word_index(words)
     word_list = []
+    stored = set()
     for start, end in time_intervals:
-        for index, word in enumerate(words):
-            if word.xmin <= start and end <= word.xmax:
-                if not already_stored(word.text, word_list):
-                    word_list.append(Word(word, index))
-                break
+        # first word starting before the interval and ending after it
+        index = bisect_left(ends, end)
+        if index < bisect_right(starts, start):
+            word = words[index]
+            if word.text not in stored:
+                stored.add(word.text)
+                word_list.append(Word(word, index))
     return word_list
 
-def extract_words_by_pitch_level(level, transcript_paths, pitch_paths):
+def extract_words_by_pitch_levels(transcript_path, pitch_path):
     """
-    Extracts words from transcripts based on specified pitch levels.
+    Extracts the words of a transcript for every pitch level, parsing each
+    TextGrid once.
 
     Args:
-        level (str): The pitch level to filter by (e.g., "high", "low").
-        transcript_paths (list): List of paths to transcript TextGrid files.
-        pitch_paths (list): List of paths to pitch level TextGrid files.
+        transcript_path (str): Path to the transcript TextGrid file.
+        pitch_path (str): Path to the pitch level TextGrid file.
 
     Returns:
-        list: A list of lists containing Word objects for each transcript.
+        dict: Pitch levels as keys and lists of Word objects as values.
     """
-    words_by_pitch_level = []
-    for transcript_path, pitch_path in zip(transcript_paths, pitch_paths):
-        words = tgt.TextGrid(transcript_path)["words"]
-        pitch_intervals = tgt.TextGrid(pitch_path)["polytonia"]
-        time_intervals = [
-            (interval.xmin, interval.xmax)
-            for interval in pitch_intervals
-            if interval.text.lower() == PITCH_LEVELS[level].lower()
-        ]
-        words_by_pitch_level.append(find_words_in_intervals(time_intervals, words))
-    return words_by_pitch_level
+    words = tgt.TextGrid(transcript_path)["words"]
+    pitch_intervals = tgt.TextGrid(pitch_path)["polytonia"]
+    levels_by_label = {label.lower(): level for level, label in PITCH_LEVELS.items()}
+    time_intervals = {level: [] for level in PITCH_LEVELS}
+    # Bucket the pitch intervals by level in a single pass
+    for interval in pitch_intervals:
+        level = levels_by_label.get(interval.text.lower())
+        if level is not None:
+            time_intervals[level].append((interval.xmin, interval.xmax))
+    word_index = build_word_index(words)
+    return {
+        level: find_words_in_intervals(intervals, words, word_index)
+        for level, intervals in time_intervals.items()
+    }
 
 def save_to_json(data, filepath):
     """
@@ -107,14 +114,24 @@ def save_to_json(data, filepath):
     with open(filepath, 'w') as json_file:
         json.dump(data, json_file, ensure_ascii=False, indent=4)
 
-def main():
+def process_file(transcript_path, pitch_path):
+    """
+    Extracts the words of every pitch level of a transcript and saves them to
+    {transcript name}_words.json.
+    """
+    base_filename = os.path.splitext(os.path.basename(transcript_path))[0]
+    words_by_level = extract_words_by_pitch_levels(transcript_path, pitch_path)
+    result = {
+        level: [word.to_dict() for word in words]
+        for level, words in words_by_level.items()
+    }
+    save_to_json(result, f"{base_filename}_words.json")
+
+def main(corpus_path, workers=1):
     """
     Main function to extract words from TextGrid files based on pitch levels.
     """
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python3 extractWordPitchLevels.py /path/to/corpus")
-
-    textgrid_paths = glob.glob(f"{sys.argv[1]}/*.TextGrid")
+    textgrid_paths = glob.glob(f"{corpus_path}/*.TextGrid")
     transcript_paths = sorted(
         [path for path in textgrid_paths if not path.endswith("polytonia.TextGrid")]
     )
@@ -122,18 +139,20 @@ def main():
         [path for path in textgrid_paths if path.endswith("polytonia.TextGrid")]
     )
 
-    for transcript_path in transcript_paths:
-        base_filename = os.path.splitext(os.path.basename(transcript_path))[0]
-        result = {}
-        
-        for level in PITCH_LEVELS.keys():
-            words_by_level = extract_words_by_pitch_level(
-                level, [transcript_path], [pitch_paths[transcript_paths.index(transcript_path)]]
-            )
-            result[level] = [word.to_dict() for word in words_by_level[0]]
-        
-        save_to_json(result, f"{base_filename}_words.json")
+    if workers <= 1:
+        for transcript_path, pitch_path in zip(transcript_paths, pitch_paths):
+            process_file(transcript_path, pitch_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(process_file, transcript_paths, pitch_paths))
 
 if __name__ == "__main__":
-    main()
-
+    parser = argparse.ArgumentParser(
+        usage="python3 extractWordPitchLevels.py /path/to/corpus [-w N]"
+    )
+    parser.add_argument("corpus_path")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    args = parser.parse_args()
+    main(args.corpus_path, workers=args.workers)
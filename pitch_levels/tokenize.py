@@ -2,63 +2,131 @@
 This module extracts words from TextGrid files based on pitch levels.
 It tokenizes transcript text using spaCy and compares it to MFA tokenized words.
 
+The spaCy model is loaded once with only its tokenizer, and the transcripts are tokenized in batches
+(optionally in several processes).
+
 Usage:
-    python3 extractWordPitchLevels.py /path/to/corpus
+    python3 tokenize.py /path/to/corpus [--n-process N] [--batch-size B]
 """
 
-import sys
-import spacy
 import glob
+import argparse
+import spacy
 import textgrids as tgt
 
+SPACY_MODEL = "fr_core_news_sm"
+# Only the tokens are used, the other components of the model are not loaded
+UNUSED_PIPES = [
+    "tok2vec",
+    "morphologizer",
+    "parser",
+    "senter",
+    "attribute_ruler",
+    "lemmatizer",
+    "ner",
+]
 
-def tokenize_text(file_path):
+
+def load_nlp():
     """
-    Tokenizes the text in the given file using spaCy.
+    Loads the spaCy model without the components that are not needed for
+    tokenization.
+    """
+    return spacy.load(SPACY_MODEL, exclude=UNUSED_PIPES)
+
+
+def read_text(file_path):
+    with open(file_path, "r") as file:
+        return file.read().lower().replace("\n", " ").replace("-", " ")
+
+
+def merge_apostrophes(tokens):
+    """
+    Merges each token ending with an apostrophe with the next token
+    (e.g. "l'" and "homme" become "l'homme").
 
     Args:
-        file_path (str): Path to the text file to be tokenized.
+        tokens (List[str]): Tokens of a text.
 
     Returns:
-        List[str]: A list of tokens from the text file.
+        List[str]: The merged tokens.
     """
-    with open(file_path, "r") as file:
-        text = file.read().lower().replace("\n", " ").replace("-", " ")
-    
-    nlp = spacy.load("fr_core_news_sm")
-    doc = nlp(text)
-    
-    tokens = [token.text for token in doc if token.text not in ",?.- "]
-    
+    merged = []
     i = 0
     while i < len(tokens):
-        if tokens[i].endswith("'"):
-            tokens[i] += tokens[i + 1]
-            tokens.pop(i + 1)
+        token = tokens[i]
+        if token.endswith("'") and i + 1 < len(tokens):
+            token += tokens[i + 1]
+            i += 1
+        merged.append(token)
         i += 1
-    
-    return tokens
+    return merged
 
 
-def extract_words(corpus_path):
+def get_tokens(doc):
+    tokens = [token.text for token in doc if token.text not in ",?.- "]
+    return merge_apostrophes(tokens)
+
+
+def tokenize_text(file_path, nlp=None):
+    """
+    Tokenizes the text in the given file using spaCy.
+
+    Args:
+        file_path (str): Path to the text file to be tokenized.
+        nlp (spacy.Language): Loaded spaCy model, loaded if None.
+
+    Returns:
+        List[str]: A list of tokens from the text file.
+    """
+    nlp = nlp or load_nlp()
+    return get_tokens(nlp(read_text(file_path)))
+
+
+def tokenize_texts(file_paths, nlp, n_process=1, batch_size=32):
+    """
+    Tokenizes the texts of several files with spaCy, in batches.
+
+    Args:
+        file_paths (List[str]): Paths to the text files to be tokenized.
+        nlp (spacy.Language): Loaded spaCy model.
+        n_process (int): Number of processes used by spaCy.
+        batch_size (int): Number of texts in each batch.
+
+    Yields:
+        List[str]: The tokens of each file, in the order of file_paths.
+    """
+    texts = (read_text(file_path) for file_path in file_paths)
+    for doc in nlp.pipe(texts, n_process=n_process, batch_size=batch_size):
+        yield get_tokens(doc)
+
+
+def extract_words(corpus_path, n_process=1, batch_size=32):
     """
     Extracts words from TextGrid files and compares them with spaCy tokens.
 
     Args:
         corpus_path (str): Path to the corpus directory containing text and TextGrid files.
+        n_process (int): Number of processes used by spaCy.
+        batch_size (int): Number of transcripts in each spaCy batch.
     """
     transcript_paths = sorted(glob.glob(f"{corpus_path}/*.txt"))
     textgrid_paths = glob.glob(f"{corpus_path}/*.TextGrid")
     aligned_tgt_paths = sorted(
         [path for path in textgrid_paths if not path.endswith("polytonia.TextGrid")]
     )
-    
-    for transcript, textgrid in zip(transcript_paths, aligned_tgt_paths):
+    # zip stops at the shortest list, only tokenize the transcripts compared
+    transcript_paths = transcript_paths[: len(aligned_tgt_paths)]
+    nlp = load_nlp()
+    all_spacy_tokens = tokenize_texts(transcript_paths, nlp, n_process, batch_size)
+
+    for transcript, textgrid, spacy_tokens in zip(
+        transcript_paths, aligned_tgt_paths, all_spacy_tokens
+    ):
         mfa_tokens = [
             word.text for word in tgt.TextGrid(textgrid)["words"] if word.text != ""
         ]
-        spacy_tokens = tokenize_text(transcript)
-        
+
         print(f"FOR FILE {transcript}")
         print(f"MFA TOKENS:\n {len(mfa_tokens)}\n")
         print(f"SPACY TOKENS:\n {len(spacy_tokens)}\n")
@@ -68,11 +136,16 @@ def main():
     """
     Main function to handle the extraction process from the command line.
     """
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python3 extractWordPitchLevels.py /path/to/corpus")
-    
-    corpus_path = sys.argv[1]
-    extract_words(corpus_path)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_path")
+    parser.add_argument(
+        "-n", "--n-process", type=int, default=1, help="number of spaCy processes"
+    )
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=32, help="transcripts per batch"
+    )
+    args = parser.parse_args()
+    extract_words(args.corpus_path, args.n_process, args.batch_size)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+This module benchmarks the vectorised aggregation and extreme word extraction of plot_csv.py against
+the previous row by row implementations, on a synthetic word-level dataset of the size of the corpus,
+and checks that both give the same output.
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from plot_csv import reshape_data, find_extreme_words
+
+PITCH_COLUMNS = ["L", "M", "H", "B", "T"]
+
+
+def reshape_data_iterrows(filtered_df, liwc_columns, pitch_columns):
+    """
+    The previous implementation of plot_csv.reshape_data, a loop over the rows of the DataFrame.
+    """
+    plot_data = []
+    for _, row in filtered_df.iterrows():
+        persuasiveness = row["persuasiveness"]
+        for pitch in pitch_columns:
+            if row[pitch] == 1:
+                for liwc in liwc_columns:
+                    if row[liwc] == 1:
+                        plot_data.append([pitch, liwc, persuasiveness])
+    plot_df = pd.DataFrame(plot_data, columns=["Pitch", "LIWC", "Persuasiveness"])
+    return plot_df.groupby(["Pitch", "LIWC"], as_index=False).agg(
+        AvgPersuasiveness=("Persuasiveness", "mean"),
+        Count=("Persuasiveness", "size"),
+    )
+
+
+def find_extreme_words_iterrows(filtered_df, liwc_columns, pitch_columns):
+    """
+    The previous implementation of plot_csv.find_extreme_words, which did not filter by persuasiveness.
+    """
+    extreme_words = []
+    for _, row in filtered_df.iterrows():
+        word = row["word"]
+        clip = row["clip"]
+        persuasiveness = row["persuasiveness"]
+        for pitch in pitch_columns:
+            if pitch == "none":
+                continue
+            if row[pitch] == 1:
+                for liwc in liwc_columns:
+                    if row[liwc] == 1:
+                        extreme_words.append([word, clip, pitch, liwc, persuasiveness])
+    return pd.DataFrame(extreme_words, columns=["Word", "Clip", "Pitch", "LIWC", "Persuasiveness"])
+
+
+def create_dataset(n_words, n_liwc, liwc_density=0.05, seed=0):
+    """
+    Creates a synthetic dataset with the columns of merged_vectors.csv.
+
+    Parameters:
+        n_words (int): The number of words (rows).
+        n_liwc (int): The number of LIWC categories.
+        liwc_density (float): The probability of a word to belong to each LIWC category.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        tuple: The DataFrame and the list of LIWC category column names.
+    """
+    rng = np.random.default_rng(seed)
+    liwc_columns = [f"liwc{i:03d}" for i in range(n_liwc)]
+    df = pd.DataFrame(
+        {
+            "clip": rng.integers(0, 1000, n_words).astype(str),
+            "word": rng.integers(0, 5000, n_words).astype(str),
+            "persuasiveness": rng.integers(10, 70, n_words) / 10,
+        }
+    )
+    pitch = np.zeros((n_words, len(PITCH_COLUMNS)), dtype=np.int64)
+    pitch[np.arange(n_words), rng.integers(0, len(PITCH_COLUMNS), n_words)] = 1
+    # some words have no pitch level
+    pitch[rng.random(n_words) < 0.3] = 0
+    liwc = (rng.random((n_words, n_liwc)) < liwc_density).astype(np.int64)
+    df = pd.concat(
+        [
+            df,
+            pd.DataFrame(pitch, columns=PITCH_COLUMNS),
+            pd.DataFrame(liwc, columns=liwc_columns),
+        ],
+        axis=1,
+    )
+    return df, liwc_columns
+
+
+def benchmark(function, *arguments, repeat=1):
+    """
+    Returns the result of the function and its best running time in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*arguments)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def compare(new_df, old_df):
+    """
+    Checks that two DataFrames are equal, the floats up to rounding errors.
+    """
+    pd.testing.assert_frame_equal(new_df, old_df, check_exact=False, rtol=1e-12, check_dtype=False)
+
+
+def main(n_words, n_liwc, repeat, min_persuasiveness=3, max_persuasiveness=4.5):
+    df, liwc_columns = create_dataset(n_words, n_liwc)
+    print(f"{n_words} words, {len(PITCH_COLUMNS)} pitch levels, {n_liwc} LIWC categories")
+
+    old_df, old_time = benchmark(reshape_data_iterrows, df, liwc_columns, PITCH_COLUMNS)
+    new_df, new_time = benchmark(reshape_data, df, liwc_columns, PITCH_COLUMNS, repeat=repeat)
+    compare(new_df, old_df)
+    print(f"reshape_data: iterrows {old_time:.3f} s, vectorised {new_time:.3f} s ({old_time / new_time:.0f}x)")
+
+    # the previous implementation ignored the range, it is given the filtered rows
+    extreme = (df["persuasiveness"] <= min_persuasiveness) | (df["persuasiveness"] >= max_persuasiveness)
+    old_df, old_time = benchmark(
+        find_extreme_words_iterrows, df[extreme], liwc_columns, PITCH_COLUMNS
+    )
+    new_df, new_time = benchmark(
+        find_extreme_words,
+        df,
+        liwc_columns,
+        PITCH_COLUMNS,
+        min_persuasiveness,
+        max_persuasiveness,
+        repeat=repeat,
+    )
+    compare(new_df, old_df)
+    print(
+        f"find_extreme_words: iterrows {old_time:.3f} s, vectorised {new_time:.3f} s "
+        f"({old_time / new_time:.0f}x), {len(new_df)} rows"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--words", type=int, default=100000, help="number of words")
+    parser.add_argument("-l", "--liwc", type=int, default=100, help="number of LIWC categories")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs of the vectorised version")
+    args = parser.parse_args()
+    main(args.words, args.liwc, args.repeat)
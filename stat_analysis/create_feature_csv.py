@@ -9,11 +9,14 @@ import textgrids as tgt
 import numpy as np
 import pandas as pd
 import glob
+import argparse
+from functools import cached_property, partial
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from scores import SCORES_PATH, load_scores
 
 CORPUS_PATH = "../../corpus/wav/full"
 SAMPLE_PATH = "../../corpus/sample/wav"
-SCORES_PATH = "../../corpus/MT_aggregated_ratings.csv"
 TEXTGRID_PATH = "../../corpus/alignments"
 
 
@@ -33,30 +36,122 @@ def calculate_intensity_peaks_rate(sound, intensity_threshold, intensity_values)
     return intensity_peaks / sound.duration
 
 
-def calculate_pause_stats(id, sound):
+class AnalysisSettings:
     """
-    Calculate the average length and rate of pauses in the audio based on the TextGrid annotations.
+    The parameters of the Praat analyses, shared by every file of a run.
+    The defaults are the defaults of Praat (and of Sound.to_pitch / Sound.to_intensity).
 
     Parameters:
-        id (str): The identifier of the audio file (used to locate the corresponding TextGrid file).
-        sound (pm.Sound): The sound object representing the audio file.
+        time_step (float): The time step of the pitch and intensity analyses in seconds, None for
+            Praat's automatic step. A coarser step is faster but less precise.
+        pitch_floor (float): The pitch floor in Hertz.
+        pitch_ceiling (float): The pitch ceiling in Hertz.
+        intensity_minimum_pitch (float): The minimum pitch of the intensity analysis in Hertz.
+    """
+
+    def __init__(
+        self, time_step=None, pitch_floor=75.0, pitch_ceiling=600.0, intensity_minimum_pitch=100.0
+    ):
+        self.time_step = time_step
+        self.pitch_floor = pitch_floor
+        self.pitch_ceiling = pitch_ceiling
+        self.intensity_minimum_pitch = intensity_minimum_pitch
+
+
+class AnalysisContext:
+    """
+    The analyses of one audio file. Each Praat object (pitch, intensity, TextGrid) is computed once,
+    on first use, and its arrays are shared by every feature function.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        settings (AnalysisSettings): The parameters of the analyses.
+    """
+
+    def __init__(self, filename, settings=None):
+        self.id = filename.split("/")[-1].split(".")[0]
+        self.sound = pm.Sound(filename)
+        self.settings = settings or AnalysisSettings()
+
+    @cached_property
+    def pitch_values(self):
+        """The pitch of each frame in Hertz, 0 for unvoiced frames."""
+        pitch = self.sound.to_pitch(
+            time_step=self.settings.time_step,
+            pitch_floor=self.settings.pitch_floor,
+            pitch_ceiling=self.settings.pitch_ceiling,
+        )
+        return pitch.selected_array["frequency"]
+
+    @cached_property
+    def voiced_pitch_values(self):
+        # we remove unvoiced pitch values (usually 0 Hz)
+        return self.pitch_values[self.pitch_values > 0]
+
+    @cached_property
+    def intensity_values(self):
+        """The intensity of each frame in decibels."""
+        intensity = self.sound.to_intensity(
+            minimum_pitch=self.settings.intensity_minimum_pitch,
+            time_step=self.settings.time_step,
+        )
+        return intensity.values[0]
+
+    @cached_property
+    def avg_intensity(self):
+        return np.mean(self.intensity_values)
+
+    @cached_property
+    def pause_lengths(self):
+        """The lengths of the pauses of the aligned TextGrid, None if there is no TextGrid."""
+        try:
+            textgrid = tgt.TextGrid(f"{TEXTGRID_PATH}/{self.id}.TextGrid")
+        except FileNotFoundError:
+            print(f"file not found: {self.id}")
+            return None
+        return np.array([word.xmax - word.xmin for word in textgrid["words"] if word.text == ""])
+
+
+def calculate_avg_len_pause(context):
+    if context.pause_lengths is None:
+        return 0
+    return np.mean(context.pause_lengths)
+
+
+def calculate_pause_rate(context):
+    if context.pause_lengths is None:
+        return 0
+    return len(context.pause_lengths) / context.sound.duration
+
+
+# The features extracted from each file, in the order of the columns of the output.
+# A feature is a function of the AnalysisContext of the file: new features read the
+# shared arrays of the context and do not run another analysis of the sound.
+FEATURE_FUNCTIONS = {
+    "avg_pitch": lambda context: np.mean(context.voiced_pitch_values),
+    "avg_intensity": lambda context: context.avg_intensity,
+    "intensity_peaks_rate": lambda context: calculate_intensity_peaks_rate(
+        context.sound, context.avg_intensity, context.intensity_values
+    ),
+    "pitch_variation": lambda context: np.std(context.pitch_values),
+    "intensity_variation": lambda context: np.std(context.intensity_values),
+    "avg_len_pause": calculate_avg_len_pause,
+    "pause_rate": calculate_pause_rate,
+}
+FEATURE_COLUMNS = ["id", *FEATURE_FUNCTIONS]
+
+
+def compute_features(context):
+    """
+    Compute every feature of FEATURE_FUNCTIONS from the analyses of a file.
+
+    Parameters:
+        context (AnalysisContext): The analyses of the audio file.
 
     Returns:
-        tuple: A tuple containing the average length of pauses (float) and the pause rate per second (float).
-    """
-    try:
-        textgrid = tgt.TextGrid(f"{TEXTGRID_PATH}/{id}.TextGrid")
-    except FileNotFoundError:
-        print(f"file not found: {id}")
-        return 0, 0
-    words = textgrid["words"]
-    pauses = []
-    for word in words:
-        if word.text == "":
-            pauses.append(word.xmax - word.xmin)
-    avg_len_pause = np.mean(pauses)
-    pause_rate = len(pauses) / sound.duration
-    return avg_len_pause, pause_rate
+        dict: The value of each feature, by name.
+    """
+    return {name: function(context) for name, function in FEATURE_FUNCTIONS.items()}
 
 
 class Features:
@@ -104,44 +199,28 @@ class Features:
         )
 
     @staticmethod
-    def new(filename):
+    def new(filename, settings=None):
         """
         Create a new Features object from an audio file.
 
         Parameters:
             filename (str): The path to the audio file.
+            settings (AnalysisSettings): The parameters of the Praat analyses, the defaults of Praat if None.
 
         Returns:
             Features: A Features object containing the calculated features of the audio.
         """
-        sound = pm.Sound(filename)
-        id = filename.split("/")[-1].split(".")[0]
-        # calculate averages
-        pitch_values = sound.to_pitch().selected_array["frequency"]
-        # we remove unvoiced pitch values (usually 0 Hz)
-        average_pitch = np.mean(pitch_values[pitch_values > 0])
-
-        intensity_values = sound.to_intensity().values[0]
-        average_intensity = np.mean(intensity_values)
-
-        # calculate intensity peaks rate
-        intensity_peaks_rate = calculate_intensity_peaks_rate(
-            sound, average_intensity, intensity_values
-        )
-
-        pitch_variation = np.std(pitch_values)
-        intensity_variation = np.std(intensity_values)
-
-        avg_len_pause, pause_rate = calculate_pause_stats(id, sound)
+        context = AnalysisContext(filename, settings)
+        features = compute_features(context)
         return Features(
-            id,
-            average_pitch,
-            average_intensity,
-            intensity_peaks_rate,
-            pitch_variation,
-            intensity_variation,
-            avg_len_pause,
-            pause_rate,
+            context.id,
+            features["avg_pitch"],
+            features["avg_intensity"],
+            features["intensity_peaks_rate"],
+            features["pitch_variation"],
+            features["intensity_variation"],
+            features["avg_len_pause"],
+            features["pause_rate"],
         )
 
 
@@ -152,24 +231,56 @@ def get_scores():
     Returns:
         pd.DataFrame: A DataFrame containing the IDs and persuasiveness scores of the audio clips.
     """
-    scores = pd.read_csv(SCORES_PATH)
-    return scores.query("`clip` == 'full' and `aggregationMethod` == 'mean'")[
-        ["id", "persuasiveness"]
-    ]
+    return load_scores(SCORES_PATH).frame
+
+
+def extract_record(filename, settings=None):
+    """
+    Returns the id and the features of an audio file as a tuple, in the order of FEATURE_COLUMNS.
+    """
+    context = AnalysisContext(filename, settings)
+    return (context.id, *compute_features(context).values())
 
 
-def main():
+def extract_records(audio_filepaths, workers=1, chunksize=4, settings=None):
+    """
+    Extracts the features of the audio files, serially or with a pool of worker processes.
+
+    Parameters:
+        audio_filepaths (list): The paths to the audio files.
+        workers (int): The number of worker processes, 1 runs in the current process.
+        chunksize (int): The number of files handed to a worker at once.
+        settings (AnalysisSettings): The parameters of the Praat analyses.
+
+    Returns:
+        list: The feature tuples of the files, in the order of audio_filepaths.
+    """
+    extract = partial(extract_record, settings=settings)
+    if workers <= 1:
+        return [extract(audio_file) for audio_file in tqdm(audio_filepaths)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        records = pool.map(extract, audio_filepaths, chunksize=chunksize)
+        return list(tqdm(records, total=len(audio_filepaths)))
+
+
+def main(workers=1, settings=None):
     """
     Main function to extract audio features from files, merge them with persuasiveness scores, and save the result.
 
     The function processes all audio files in the specified corpus directory, extracts their features, and merges
     these features with pre-existing scores into a single DataFrame. The result is then saved to a CSV file.
+
+    Parameters:
+        workers (int): The number of worker processes used for the extraction.
+        settings (AnalysisSettings): The parameters of the Praat analyses, the defaults of Praat if None.
     """
     audio_filepaths = glob.glob(f"{CORPUS_PATH}/*.wav")
-    audio_features = []
-    for audio_file in tqdm(audio_filepaths):
-        audio_features.append(Features.new(audio_file).__dict__)
-    audio_features_df = pd.DataFrame(audio_features)
+    # the clips without a score are left out of the merge, report them before the extraction
+    ids = [filename.split("/")[-1].split(".")[0] for filename in audio_filepaths]
+    for id in load_scores(SCORES_PATH).missing(ids):
+        print(f"no persuasiveness score: {id}")
+    audio_features = extract_records(audio_filepaths, workers=workers, settings=settings)
+    audio_features_df = pd.DataFrame(audio_features, columns=FEATURE_COLUMNS)
     print(audio_features_df)
     merged = pd.merge(audio_features_df, get_scores(), on="id").sort_values(by="id")
     print(merged)
@@ -177,4 +288,17 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-t", "--time-step", type=float, help="time step of the pitch and intensity analyses in seconds"
+    )
+    parser.add_argument("--pitch-floor", type=float, default=75.0, help="pitch floor in Hz")
+    parser.add_argument("--pitch-ceiling", type=float, default=600.0, help="pitch ceiling in Hz")
+    args = parser.parse_args()
+    settings = AnalysisSettings(
+        time_step=args.time_step, pitch_floor=args.pitch_floor, pitch_ceiling=args.pitch_ceiling
+    )
+    main(workers=args.workers, settings=settings)
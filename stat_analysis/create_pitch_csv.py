@@ -1,107 +1,221 @@
 import glob
+import argparse
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import textgrids as tgt
+from scores import SCORES_PATH, load_scores
 
 TEXTGRIDS_PATH = "../../corpus/alignments"
 PITCH_PATH = "../../corpus/polytonia"
-SCORES_PATH = "../../corpus/MT_aggregated_ratings.csv"
 
 PITCH_LEVELS = ["none", "L", "M", "H", "B", "T"]
+OUTPUT_SCHEMA = pa.schema(
+    [("clip", pa.string()), ("persuasiveness", pa.float64()), ("word", pa.string())]
+    + [(level, pa.int8()) for level in PITCH_LEVELS]
+)
 
 
 def get_score(id):
-    df = pd.read_csv(SCORES_PATH)
-    return float(
-        df.query("`clip` == 'full' and `aggregationMethod` == 'mean' and `id` == @id")[
-            "persuasiveness"
-        ].iloc[0]
-    )
+    return load_scores(SCORES_PATH)[id]
 
 
-class Word:
-    def __init__(self, text, none, l, m, h, b, t):
-        self.text = text
-        self.none = none
-        self.l = l
-        self.m = m
-        self.h = h
-        self.b = b
-        self.t = t
+# Polytonia labels are mapped to a pitch level by the first of these letters they
+# contain (case-insensitive); other labels are counted as "none". No label is
+# mapped to "L", the column is kept for the layout of the output.
+LABEL_LETTERS = ["h", "m", "b", "t"]
 
-    def get_pitch_vec(self):
-        return [self.none, self.l, self.m, self.h, self.b, self.t]
 
-    @staticmethod
-    def new(text):
-        return Word(text, 0, 0, 0, 0, 0, 0)
-
-    def to_dict(self, clip_id, persuasiveness):
-        return {
-            "clip": clip_id,
-            "persuasiveness": persuasiveness,
-            "word": self.text,
-            "none": self.none,
-            "L": self.l,
-            "M": self.m,
-            "H": self.h,
-            "B": self.b,
-            "T": self.t,
-        }
+def get_label_levels(labels):
+    """
+    Returns the column of PITCH_LEVELS of each polytonia label.
+    """
+    lower = np.char.lower(np.array(labels, dtype=str))
+    levels = np.full(len(labels), PITCH_LEVELS.index("none"), dtype=np.intp)
+    # the first letters of LABEL_LETTERS take precedence, so they are assigned last
+    for letter in reversed(LABEL_LETTERS):
+        levels[np.char.find(lower, letter) >= 0] = PITCH_LEVELS.index(letter.upper())
+    return levels
 
 
 class Clip:
-    def __init__(self, id, score, words: list[Word]):
+    """
+    The words of a clip with their pitch levels.
+
+    Parameters:
+        id (str): The identifier of the clip.
+        score (float): The persuasiveness score of the clip.
+        words (np.ndarray): The text of the words.
+        pitch (np.ndarray): One row per word and one 0/1 column per level of PITCH_LEVELS.
+    """
+
+    def __init__(self, id, score, words, pitch):
         self.id = id
         self.score = score
         self.words = words
+        self.pitch = pitch
 
     def to_df(self):
-        # Convert the Clip to a DataFrame where each Word is a row
-        data = [word.to_dict(self.id, self.score) for word in self.words]
-        return pd.DataFrame(data)
+        # One row per word
+        return pd.DataFrame(
+            {
+                "clip": self.id,
+                "persuasiveness": self.score,
+                "word": self.words,
+                **{level: self.pitch[:, i] for i, level in enumerate(PITCH_LEVELS)},
+            }
+        )
 
     @staticmethod
-    def new(id, words, pitch_annotations):
-        words_list = []
-        for word in words:
-            if word.text == "":
+    def new(id, words, pitch_annotations, score=None, all_annotations=False):
+        """
+        Labels the words of a clip with the pitch levels of the annotations they contain.
+
+        Both tiers are sorted interval tiers without overlaps, so the annotations
+        contained in a word are a contiguous run of the polytonia tier: from the first
+        one starting after the word begins to the last one ending before it ends.
+        The runs of every word are found with a single sorted search of each tier.
+
+        Parameters:
+            id (str): The identifier of the clip.
+            words (tgt.Tier): The words tier of the alignment, pauses are skipped.
+            pitch_annotations (tgt.Tier): The polytonia tier.
+            score (float): The persuasiveness score, looked up by id if None.
+            all_annotations (bool): Set the level of every annotation contained in a
+                word, instead of the first one only.
+
+        Returns:
+            Clip: The words of the clip and their one-hot pitch levels.
+        """
+        words = [word for word in words if word.text != ""]
+        word_xmin = np.array([word.xmin for word in words], dtype=float)
+        word_xmax = np.array([word.xmax for word in words], dtype=float)
+        annotation_xmin = np.array([annotation.xmin for annotation in pitch_annotations], dtype=float)
+        annotation_xmax = np.array([annotation.xmax for annotation in pitch_annotations], dtype=float)
+        levels = get_label_levels([annotation.text for annotation in pitch_annotations])
+
+        start = np.searchsorted(annotation_xmin, word_xmin, side="left")
+        stop = np.searchsorted(annotation_xmax, word_xmax, side="right")
+        counts = np.maximum(stop - start, 0)
+        if all_annotations:
+            rows = np.repeat(np.arange(len(words)), counts)
+            # start of the run of each word, then the following annotations
+            offsets = np.repeat(start - (np.cumsum(counts) - counts), counts)
+            annotations = np.arange(counts.sum()) + offsets
+        else:
+            rows = np.flatnonzero(counts)
+            annotations = start[rows]
+        pitch = np.zeros((len(words), len(PITCH_LEVELS)), dtype=np.int8)
+        pitch[rows, levels[annotations]] = 1
+
+        if score is None:
+            score = get_score(id)
+        return Clip(id, score, np.array([word.text for word in words], dtype=object), pitch)
+
+
+def pair_clips(transcriptions, pitch_levels):
+    """
+    Pairs the alignment and polytonia TextGrids of each clip by the ID in their name.
+
+    Returns:
+        pairs (list): (id, alignment path, polytonia path) of each clip, sorted by ID.
+        missing (list): files without a matching alignment or polytonia TextGrid.
+    """
+    alignments = {path.split("/")[-1].split(".")[0]: path for path in transcriptions}
+    polytonia = {path.split("/")[-1].split(".")[0]: path for path in pitch_levels}
+    missing = [alignments[id] for id in sorted(alignments.keys() - polytonia.keys())]
+    missing += [polytonia[id] for id in sorted(polytonia.keys() - alignments.keys())]
+    pairs = [(id, alignments[id], polytonia[id]) for id in sorted(alignments.keys() & polytonia.keys())]
+    return pairs, missing
+
+
+def process_clip(id, transcript, pitch_level, score, all_annotations=False):
+    words = tgt.TextGrid(transcript)["words"]
+    pitch_annotations = tgt.TextGrid(pitch_level)["polytonia"]
+    return Clip.new(id, words, pitch_annotations, score, all_annotations).to_df()
+
+
+def write_clips(clip_dataframes, parquet_path, csv_path=None):
+    """
+    Writes the words of each clip to a Parquet file, and a CSV file if csv_path is
+    given, as soon as the clip is processed.
+
+    Parameters:
+        clip_dataframes (iterable): The DataFrame of each clip.
+        parquet_path (str): The path to the Parquet file.
+        csv_path (str): The path to the CSV file, None to only write the Parquet file.
+
+    Returns:
+        int: The number of words written.
+    """
+    rows = 0
+    with ExitStack() as stack:
+        parquet = stack.enter_context(pq.ParquetWriter(parquet_path, OUTPUT_SCHEMA))
+        csv = stack.enter_context(open(csv_path, "w", newline="")) if csv_path else None
+        for clip_df in clip_dataframes:
+            if clip_df.empty:
                 continue
-            begin, end = word.xmin, word.xmax
-            word_instance = Word.new(word.text)
-            for annotation in pitch_annotations:
-                if annotation.xmin >= begin and annotation.xmax <= end:
-                    if "h" in annotation.text.lower():
-                        word_instance.h = 1
-                    elif "m" in annotation.text.lower():
-                        word_instance.m = 1
-                    elif "b" in annotation.text.lower():
-                        word_instance.b = 1
-                    elif "t" in annotation.text.lower():
-                        word_instance.t = 1
-                    else:
-                        word_instance.none = 1
-                    break
-            words_list.append(word_instance)
-        return Clip(id, get_score(id), words_list)
-
-
-def main():
-    transcriptions = sorted(glob.glob(f"{TEXTGRIDS_PATH}/*.TextGrid"))
-    pitch_levels = sorted(glob.glob(f"{PITCH_PATH}/*.TextGrid"))
-    words_dataframes = []
-
-    for transcript, pitch_level in zip(transcriptions, pitch_levels):
-        words = tgt.TextGrid(transcript)["words"]
-        pitch_annotations = tgt.TextGrid(pitch_level)["polytonia"]
-        id = transcript.split("/")[-1].split(".")[0]
-        words_dataframes.append(Clip.new(id, words, pitch_annotations).to_df())
-
-    # Merge all dataframes into a single dataframe
-    final_df = pd.concat(words_dataframes, ignore_index=True)
-
-    final_df.to_csv("output.csv", index=False)
-    print(final_df)
+            parquet.write_table(pa.Table.from_pandas(clip_df, schema=OUTPUT_SCHEMA, preserve_index=False))
+            if csv is not None:
+                clip_df.to_csv(csv, header=rows == 0, index=False)
+            rows += len(clip_df)
+    return rows
+
+
+def main(all_annotations=False, workers=1, write_csv=True):
+    """
+    Builds the table of the words of every clip with their pitch levels and the
+    persuasiveness score of the clip, and saves it as output.parquet (and output.csv).
+
+    Parameters:
+        all_annotations (bool): Set the level of every annotation contained in a word.
+        workers (int): The number of worker processes, 1 runs in the current process.
+        write_csv (bool): Also save the table as output.csv.
+    """
+    pairs, missing = pair_clips(
+        glob.glob(f"{TEXTGRIDS_PATH}/*.TextGrid"), glob.glob(f"{PITCH_PATH}/*.TextGrid")
+    )
+    for path in missing:
+        print(f"No matching alignment or polytonia TextGrid for {path}")
+    ids = [pair[0] for pair in pairs]
+    # every clip needs a score, stop before parsing any TextGrid otherwise
+    scores = load_scores(SCORES_PATH)
+    scores.require(ids)
+    arguments = (
+        ids,
+        [pair[1] for pair in pairs],
+        [pair[2] for pair in pairs],
+        [scores[id] for id in ids],
+        [all_annotations] * len(pairs),
+    )
+
+    csv_path = "output.csv" if write_csv else None
+    # The clips are written in the order of their IDs, as soon as they are processed
+    if workers <= 1:
+        rows = write_clips(map(process_clip, *arguments), "output.parquet", csv_path)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            clip_dataframes = pool.map(process_clip, *arguments, chunksize=4)
+            rows = write_clips(clip_dataframes, "output.parquet", csv_path)
+    print(f"{rows} words of {len(pairs)} clips written")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--all-annotations",
+        action="store_true",
+        help="set the level of every annotation of a word, not only the first one",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--no-csv", action="store_true", help="only write output.parquet, not output.csv"
+    )
+    args = parser.parse_args()
+    main(all_annotations=args.all_annotations, workers=args.workers, write_csv=not args.no_csv)
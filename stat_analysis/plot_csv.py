@@ -10,6 +10,16 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 
 CSV_PATH = "merged_vectors.csv"
+PITCH_COLUMNS = [
+    # "none",
+    "L",
+    "M",
+    "H",
+    "B",
+    "T",
+]
+MIN_PERSUASIVENESS = 3
+MAX_PERSUASIVENESS = 4.5
 
 
 def filter_dataframe(df, dimension, liwc_columns, pitch_columns):
@@ -33,6 +43,20 @@ def filter_dataframe(df, dimension, liwc_columns, pitch_columns):
     return filtered_df.query("`persuasiveness` >= 4.5")
 
 
+def get_indicators(df, columns):
+    """
+    Returns the indicator matrix of the columns: 1 where a word has the category, 0 elsewhere.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame containing the data.
+        columns (list): List of category column names.
+
+    Returns:
+        np.ndarray: A (words x columns) matrix of 0.0 and 1.0.
+    """
+    return (df[list(columns)].to_numpy() == 1).astype(np.float64)
+
+
 def reshape_data(filtered_df, liwc_columns, pitch_columns):
     """
     Reshapes the filtered DataFrame to prepare data for plotting.
@@ -45,27 +69,30 @@ def reshape_data(filtered_df, liwc_columns, pitch_columns):
     Returns:
         pd.DataFrame: A DataFrame containing the reshaped data, grouped by pitch and LIWC categories, 
                       with average persuasiveness and count of occurrences.
+
+    The counts and the sums of persuasiveness of every (pitch, LIWC) pair are the products of the
+    pitch and LIWC indicator matrices, instead of a loop over the rows.
     """
-    plot_data = []
-    for _, row in filtered_df.iterrows():
-        word = row["word"]
-        persuasiveness = row["persuasiveness"]
-        # Check each pitch category for a match
-        for pitch in pitch_columns:
-            if row[pitch] == 1:  # If the word has this pitch category
-                # Check each LIWC category for a match
-                for liwc in liwc_columns:
-                    if row[liwc] == 1:  # If the word belongs to this LIWC category
-                        plot_data.append([pitch, liwc, persuasiveness])
-
-    # Convert the list into a DataFrame
-    plot_df = pd.DataFrame(plot_data, columns=["Pitch", "LIWC", "Persuasiveness"])
-
-    # Group by Pitch and LIWC to calculate the average persuasiveness and count occurrences
-    grouped_df = plot_df.groupby(["Pitch", "LIWC"], as_index=False).agg(
-        AvgPersuasiveness=("Persuasiveness", "mean"),
-        Count=("Persuasiveness", "size"),  # Count the number of occurrences
+    pitch = get_indicators(filtered_df, pitch_columns)
+    liwc = get_indicators(filtered_df, liwc_columns)
+    persuasiveness = filtered_df["persuasiveness"].to_numpy(dtype=np.float64)
+
+    # Cell (i, j) of the products counts the words with pitch i and LIWC category j,
+    # and sums their persuasiveness
+    counts = pitch.T @ liwc
+    sums = (pitch * persuasiveness[:, None]).T @ liwc
+
+    # Keep the (pitch, LIWC) pairs found at least once, sorted as groupby does
+    pitch_index, liwc_index = np.nonzero(counts)
+    grouped_df = pd.DataFrame(
+        {
+            "Pitch": [pitch_columns[i] for i in pitch_index],
+            "LIWC": [liwc_columns[j] for j in liwc_index],
+            "AvgPersuasiveness": sums[pitch_index, liwc_index] / counts[pitch_index, liwc_index],
+            "Count": counts[pitch_index, liwc_index].astype(np.int64),
+        }
     )
+    grouped_df = grouped_df.sort_values(by=["Pitch", "LIWC"], ignore_index=True)
     return grouped_df
 
 
@@ -122,40 +149,66 @@ def plot_dataframe(plot_df):
     # Display the plot
     plt.show()
 
+def get_nonzero_entries(df, columns):
+    """
+    Returns the coordinates of the 1s of the indicator matrix of the columns, the sparse form of
+    the matrix.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame containing the data.
+        columns (list): List of category column names.
+
+    Returns:
+        tuple: The row and the column index of each entry, sorted by row then column.
+    """
+    return np.nonzero(df[list(columns)].to_numpy() == 1)
+
+
 def find_extreme_words(filtered_df, liwc_columns, pitch_columns, min_persuasiveness, max_persuasiveness):
     """
-    Finds words and their related LIWC categories that fall within a specified persuasiveness range.
+    Finds words and their related LIWC categories whose persuasiveness is outside a specified range,
+    at most min_persuasiveness or at least max_persuasiveness.
 
     Parameters:
         filtered_df (pd.DataFrame): The DataFrame containing the data.
         liwc_columns (list): List of LIWC category column names.
         pitch_columns (list): List of pitch category column names.
-        min_persuasiveness (float): The minimum persuasiveness score to filter by.
-        max_persuasiveness (float): The maximum persuasiveness score to filter by.
+        min_persuasiveness (float): The highest low persuasiveness score.
+        max_persuasiveness (float): The lowest high persuasiveness score.
 
     Returns:
         pd.DataFrame: A DataFrame of words with their corresponding LIWC categories, 
-                      pitch categories, clips, and persuasiveness scores within the specified range.
-    """
-    extreme_words = []
-
-    for _, row in filtered_df.iterrows():
-        word = row["word"]
-        clip = row["clip"]
-        persuasiveness = row["persuasiveness"]
-        
-        # if min_persuasiveness >= persuasiveness or persuasiveness >= max_persuasiveness:
-        for pitch in pitch_columns:
-            if pitch == 'none':
-                continue
-            if row[pitch] == 1:  # If the word has this pitch category
-                for liwc in liwc_columns:
-                    if row[liwc] == 1:  # If the word belongs to this LIWC category
-                        extreme_words.append([word, clip, pitch, liwc, persuasiveness])
-
-    # Convert the list into a DataFrame
-    extreme_words_df = pd.DataFrame(extreme_words, columns=["Word", "Clip", "Pitch", "LIWC", "Persuasiveness"])
-    
+                      pitch categories, clips, and persuasiveness scores outside the specified range,
+                      one row per (word, pitch, LIWC) triple.
+    """
+    persuasiveness = filtered_df["persuasiveness"]
+    extreme_df = filtered_df[
+        (persuasiveness <= min_persuasiveness) | (persuasiveness >= max_persuasiveness)
+    ]
+    pitch_columns = [pitch for pitch in pitch_columns if pitch != "none"]
+    pitch_rows, pitch_index = get_nonzero_entries(extreme_df, pitch_columns)
+    liwc_rows, liwc_index = get_nonzero_entries(extreme_df, liwc_columns)
+
+    # The LIWC entries of each row are contiguous: they start at liwc_starts[row]
+    liwc_counts = np.bincount(liwc_rows, minlength=len(extreme_df))
+    liwc_starts = np.cumsum(liwc_counts) - liwc_counts
+
+    # Each pitch entry is paired with every LIWC entry of its row, in the order of the columns
+    repeats = liwc_counts[pitch_rows]
+    rows = np.repeat(pitch_rows, repeats)
+    pitches = np.repeat(pitch_index, repeats)
+    offsets = np.repeat(liwc_starts[pitch_rows] - (np.cumsum(repeats) - repeats), repeats)
+    liwcs = liwc_index[np.arange(repeats.sum()) + offsets]
+
+    extreme_words_df = pd.DataFrame(
+        {
+            "Word": extreme_df["word"].to_numpy()[rows],
+            "Clip": extreme_df["clip"].to_numpy()[rows],
+            "Pitch": np.asarray(pitch_columns, dtype=object)[pitches],
+            "LIWC": np.asarray(liwc_columns, dtype=object)[liwcs],
+            "Persuasiveness": extreme_df["persuasiveness"].to_numpy()[rows],
+        }
+    )
     return extreme_words_df
 
 
@@ -174,6 +227,37 @@ def display_extreme_words(extreme_words_df):
         extreme_words_df.to_csv("extreme_words.csv", index=False)
 
 
+def get_liwc_columns(df):
+    """
+    Returns the LIWC category column names of the dataset, from BigWords to remplisseur.
+    """
+    return df.columns[
+        df.columns.get_loc("BigWords") : df.columns.get_loc("remplisseur") + 1
+    ]
+
+
+def load_extreme_words(
+    csv_path=CSV_PATH, min_persuasiveness=MIN_PERSUASIVENESS, max_persuasiveness=MAX_PERSUASIVENESS
+):
+    """
+    Builds the table of extreme words of the dataset, as saved in extreme_words.csv by main.
+
+    Parameters:
+        csv_path (str): The path to the word-level dataset.
+        min_persuasiveness (float): The highest low persuasiveness score.
+        max_persuasiveness (float): The lowest high persuasiveness score.
+
+    Returns:
+        pd.DataFrame: The extreme words, see find_extreme_words.
+    """
+    df = pd.read_csv(csv_path)
+    liwc_columns = get_liwc_columns(df)
+    filtered_df = filter_dataframe(df, "persuasiveness", liwc_columns, PITCH_COLUMNS)
+    return find_extreme_words(
+        filtered_df, liwc_columns, PITCH_COLUMNS, min_persuasiveness, max_persuasiveness
+    )
+
+
 def main():
     """
     Main function that orchestrates the filtering, reshaping, and plotting of the data.
@@ -186,18 +270,8 @@ def main():
     # Load the dataset from the CSV file
     df = pd.read_csv(CSV_PATH)
     
-    liwc_columns = df.columns[
-        df.columns.get_loc("BigWords") : df.columns.get_loc("remplisseur") + 1
-    ]
-    
-    pitch_columns = [
-        # "none",
-        "L",
-        "M",
-        "H",
-        "B",
-        "T",
-    ]
+    liwc_columns = get_liwc_columns(df)
+    pitch_columns = PITCH_COLUMNS
 
     # Filter the DataFrame for relevant columns
     filtered_df = filter_dataframe(df, "persuasiveness", liwc_columns, pitch_columns)
@@ -210,9 +284,9 @@ def main():
     plot_dataframe(plot_df)
     
     # Find and display words with extreme persuasiveness
-    min_persuasiveness = 3
-    max_persuasiveness = 4.5
-    extreme_words_df = find_extreme_words(filtered_df, liwc_columns, pitch_columns, min_persuasiveness, max_persuasiveness)
+    extreme_words_df = find_extreme_words(
+        filtered_df, liwc_columns, pitch_columns, MIN_PERSUASIVENESS, MAX_PERSUASIVENESS
+    )
     display_extreme_words(extreme_words_df)
 
 
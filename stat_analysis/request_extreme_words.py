@@ -1,24 +1,38 @@
+import argparse
 import pandas as pd
+from plot_csv import load_extreme_words
 
 CSV_PATH = "extreme_words.csv"
 
-def main():
-    df = pd.read_csv(CSV_PATH)
-    colere = df.query("`LIWC` == 'colère' and `Persuasiveness` <= 3.0")
-    colere.to_csv("low_high_words/colere_low.csv", index=False)
+# Output file -> filter of the extreme words
+QUERIES = {
+    "low_high_words/colere_low.csv": "`LIWC` == 'colère' and `Persuasiveness` <= 3.0",
+    "low_high_words/bottom_colere.csv": "`LIWC` == 'colère' and `Pitch` == 'B'",
+    "low_high_words/juron_middle_highscore.csv": "`LIWC` == 'juron' and `Pitch` == 'M'",
+    "low_high_words/pronomimp_mid.csv": "`LIWC` == 'pronomimp' and `Pitch` == 'B'",
+}
 
-    bottom = df.query("`LIWC` == 'colère' and `Pitch` == 'B'")
-    bottom.to_csv("low_high_words/bottom_colere.csv", index=False)
 
-    juron = df.query("`LIWC` == 'juron' and `Pitch` == 'M'")
-    juron.to_csv("low_high_words/juron_middle_highscore.csv", index=False)
+def run_queries(df):
+    """
+    Saves the result of each query of QUERIES on the table of extreme words.
+    """
+    for path, query in QUERIES.items():
+        df.query(query).to_csv(path, index=False)
 
-    pronomimp = df.query("`LIWC` == 'pronomimp' and `Pitch` == 'B'")
-    pronomimp.to_csv("low_high_words/pronomimp_mid.csv", index=False)
 
+def main(from_csv=False):
+    # The table is built from the word-level dataset, unless extreme_words.csv is asked for
+    df = pd.read_csv(CSV_PATH) if from_csv else load_extreme_words()
+    run_queries(df)
 
     print(df.query("`LIWC` == 'colère' and `Pitch` == 'H'"))
     
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--from-csv", action="store_true", help=f"read the extreme words from {CSV_PATH}"
+    )
+    args = parser.parse_args()
+    main(from_csv=args.from_csv)
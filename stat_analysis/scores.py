@@ -0,0 +1,91 @@
+"""
+This module loads the persuasiveness ratings of the clips once and indexes them by clip ID,
+for the scripts that join word or audio features with the scores.
+"""
+
+from functools import lru_cache
+
+import pandas as pd
+
+SCORES_PATH = "../../corpus/MT_aggregated_ratings.csv"
+
+
+class MissingScoresError(ValueError):
+    """
+    Raised when clips have no persuasiveness score.
+
+    Parameters:
+        ids (list): The IDs of the clips without a score.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        super().__init__(f"{len(ids)} clip(s) without a persuasiveness score: {', '.join(ids)}")
+
+
+class ScoreTable:
+    """
+    The persuasiveness scores of the clips, indexed by ID.
+
+    Parameters:
+        scores (pd.DataFrame): The "id" and "persuasiveness" columns of the ratings.
+    """
+
+    def __init__(self, scores):
+        self.frame = scores
+        # the first rating of an ID is kept, as the ratings table was read before
+        first = scores.drop_duplicates(subset="id")
+        self.by_id = dict(zip(first["id"], first["persuasiveness"].astype(float)))
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, id):
+        return id in self.by_id
+
+    def __getitem__(self, id):
+        try:
+            return self.by_id[id]
+        except KeyError:
+            raise MissingScoresError([id]) from None
+
+    def missing(self, ids):
+        """
+        Returns the sorted IDs without a score.
+        """
+        return sorted(set(ids) - self.by_id.keys())
+
+    def require(self, ids):
+        """
+        Raises a MissingScoresError listing every ID without a score, if any.
+        """
+        missing = self.missing(ids)
+        if missing:
+            raise MissingScoresError(missing)
+
+    @staticmethod
+    def read(path=SCORES_PATH, clip="full", aggregation_method="mean"):
+        """
+        Reads and filters the ratings table.
+
+        Parameters:
+            path (str): The path to the ratings CSV file.
+            clip (str): The part of the clips that was rated.
+            aggregation_method (str): The aggregation of the ratings of the annotators.
+
+        Returns:
+            ScoreTable: The scores of the clips.
+        """
+        ratings = pd.read_csv(path)
+        selected = ratings[
+            (ratings["clip"] == clip) & (ratings["aggregationMethod"] == aggregation_method)
+        ]
+        return ScoreTable(selected[["id", "persuasiveness"]])
+
+
+@lru_cache(maxsize=None)
+def load_scores(path=SCORES_PATH, clip="full", aggregation_method="mean"):
+    """
+    Returns the ScoreTable of the ratings, read once per process.
+    """
+    return ScoreTable.read(path, clip, aggregation_method)
@@ -1,73 +1,192 @@
-import sys
+import os
 import glob
+import math
+import argparse
+import numpy as np
 import parselmouth as pm
 import textgrids as tgt
+from concurrent.futures import ProcessPoolExecutor
 
+# Segments extracted from each recording: output suffix -> (tier, text of the
+# intervals to extract). Pauses are the empty intervals of the words tier.
+SEGMENT_SETS = {
+    "empty": ("words", ""),
+    "e": ("phones", "ə"),
+}
 
-def get_specific_phoneme(sounds, transcripts, phoneme):
-    phone_extracts = []
-    for sound_path, transcript_path in zip(sounds, transcripts):
-        extracts = []
-        audio = pm.Sound(sound_path)
-        transcript = tgt.TextGrid(transcript_path)
-        # words = transcript["words"]
-        phones = transcript["phones"]
-        for phone in phones:
-            if phone.text == phoneme:
-                # print(f"ə phone: {phone.xmin} : {phone.xmax}")
-                extract = audio.extract_part(
-                    phone.xmin, phone.xmax, pm.WindowShape.RECTANGULAR, 1, False
-                )
-                extracts.append(extract)
-        concatenation = audio.extract_part(
-            0, 0.001, pm.WindowShape.RECTANGULAR, 1, False
-        )
-        concatenation = concatenation.concatenate(extracts)
-        phone_extracts.append(concatenation)
-    return phone_extracts
-
-
-def get_empty_extracts(sounds, transcripts):
-    empty_extracts = []
-    for sound_path, transcript_path in zip(sounds, transcripts):
-        extracts = []
-        audio = pm.Sound(sound_path)
-        transcript = tgt.TextGrid(transcript_path)
-        words = transcript["words"]
-        # phones = transcript["phones"]
-        for word in words:
-            if word.text == "":
-                # print(f"Empty word: {word.xmin} : {word.xmax}")
-                extract = audio.extract_part(
-                    word.xmin, word.xmax, pm.WindowShape.RECTANGULAR, 1, False
-                )
-                extracts.append(extract)
-        concatenation = audio.extract_part(
-            0, 0.001, pm.WindowShape.RECTANGULAR, 1, False
-        )
-        concatenation = concatenation.concatenate(extracts)
-        empty_extracts.append(concatenation)
-    return empty_extracts
-
-
-def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python3 audiotextual_manipulation.py /path/to/corpus")
-    corpus_dir = sys.argv[1]
-    sounds = []
-    transcripts = []
+
+def get_sample_range(audio, xmin, xmax):
+    """
+    Returns the indices of the samples between xmin and xmax, selected as
+    Praat does in Sound.extract_part.
+    """
+    first = max(math.ceil((xmin - audio.x1) / audio.dx), 0)
+    last = min(math.floor((xmax - audio.x1) / audio.dx), audio.n_samples - 1)
+    return first, last + 1
+
+
+def extract_segments(sound_path, transcript_path, segment_sets=SEGMENT_SETS):
+    """
+    Extracts several sets of segments from a recording, reading the sound and
+    its TextGrid only once.
+
+    Parameters:
+    sound_path (str): path of the .wav file.
+    transcript_path (str): path of the aligned TextGrid.
+    segment_sets (dict): name of each set of segments -> (tier, text of the
+    intervals to extract).
+
+    Returns:
+    dict: name of each set -> pm.Sound concatenating its segments, None if the
+    recording has no such segment.
+    """
+    audio = pm.Sound(sound_path)
+    transcript = tgt.TextGrid(transcript_path)
+    samples = audio.values
+    extracts = {}
+    for name, (tier, text) in segment_sets.items():
+        parts = []
+        for interval in transcript[tier]:
+            if interval.text == text:
+                first, last = get_sample_range(audio, interval.xmin, interval.xmax)
+                parts.append(samples[:, first:last])
+        if parts:
+            extracts[name] = pm.Sound(
+                np.concatenate(parts, axis=1), sampling_frequency=audio.sampling_frequency
+            )
+        else:
+            extracts[name] = None
+    return extracts
+
+
+def pair_files(corpus_dir, folders):
+    """
+    Pairs the .wav and .TextGrid files of each folder by their name.
+
+    Parameters:
+    corpus_dir (str): path of the corpus.
+    folders (list): names of the folders of the corpus.
+
+    Returns:
+    pairs (list): (output prefix, sound path, transcript path) of each pair.
+    The prefix is the folder, followed by the name of the file if the folder
+    contains several recordings.
+    missing (list): files without a matching sound or transcript.
+    """
+    pairs = []
+    missing = []
+    for folder in folders:
+        sounds = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in glob.glob(f"{corpus_dir}/{folder}/*.wav")
+        }
+        transcripts = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in glob.glob(f"{corpus_dir}/{folder}/*.TextGrid")
+        }
+        missing += [sounds[name] for name in sorted(sounds.keys() - transcripts.keys())]
+        missing += [
+            transcripts[name] for name in sorted(transcripts.keys() - sounds.keys())
+        ]
+        names = sorted(sounds.keys() & transcripts.keys())
+        for name in names:
+            prefix = folder if len(names) == 1 else f"{folder}_{name}"
+            pairs.append((prefix, sounds[name], transcripts[name]))
+    return pairs, missing
+
+
+def build_segment_sets(phonemes=None, words=None):
+    """
+    Builds the segment sets requested on the command line.
+
+    Parameters:
+    phonemes (list): phonemes of the phones tier to extract, as NAME=TEXT or
+    TEXT (then used as name).
+    words (list): words of the words tier to extract, in the same format
+    (e.g. empty= for the pauses).
+
+    Returns:
+    dict: name of each set -> (tier, text), SEGMENT_SETS if nothing is
+    requested.
+    """
+    if not phonemes and not words:
+        return SEGMENT_SETS
+    segment_sets = {}
+    for tier, requests in (("phones", phonemes or []), ("words", words or [])):
+        for request in requests:
+            name, _, text = request.rpartition("=")
+            segment_sets[name or text] = (tier, text)
+    return segment_sets
+
+
+def process_pair(
+    corpus_dir, prefix, sound_path, transcript_path, segment_sets=SEGMENT_SETS
+):
+    """
+    Extracts the segments of a recording and saves them as
+    {corpus_dir}/{prefix}_{name}.wav.
+
+    Returns:
+    list: names of the segment sets not found in the recording.
+    """
+    not_found = []
+    extracts = extract_segments(sound_path, transcript_path, segment_sets)
+    for name, extract in extracts.items():
+        if extract is None:
+            not_found.append(name)
+            continue
+        extract.save(f"{corpus_dir}/{prefix}_{name}.wav", "WAV")
+    return not_found
+
+
+def main(corpus_dir, workers=1, segment_sets=SEGMENT_SETS):
     with open(f"{corpus_dir}/all_folders", "r") as folders:
-        all_folders = folders.readlines()
-        for folder in all_folders:
-            sounds += glob.glob(f"{corpus_dir}/{folder.strip()}/*.wav")
-            transcripts += glob.glob(f"{corpus_dir}/{folder.strip()}/*.TextGrid")
-    empty_extracts = get_empty_extracts(sounds, transcripts)
-    for i, extract in enumerate(empty_extracts):
-        extract.save(f"{corpus_dir}/{all_folders[i].strip()}_empty.wav", "WAV")
-    e_extracts = get_specific_phoneme(sounds, transcripts, "ə")
-    for i, extract in enumerate(e_extracts):
-        extract.save(f"{corpus_dir}/{all_folders[i].strip()}_e.wav", "WAV")
+        all_folders = [folder.strip() for folder in folders if folder.strip()]
+    pairs, missing = pair_files(corpus_dir, all_folders)
+    for path in missing:
+        print(f"No matching sound or TextGrid for {path}")
+    prefixes = [pair[0] for pair in pairs]
+    sound_paths = [pair[1] for pair in pairs]
+    transcript_paths = [pair[2] for pair in pairs]
+    arguments = (
+        [corpus_dir] * len(pairs),
+        prefixes,
+        sound_paths,
+        transcript_paths,
+        [segment_sets] * len(pairs),
+    )
+    if workers <= 1:
+        not_found = list(map(process_pair, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            not_found = list(pool.map(process_pair, *arguments))
+    # Reported in the order of the folders
+    for sound_path, names in zip(sound_paths, not_found):
+        for name in names:
+            print(f"No '{name}' segment in {sound_path}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-p",
+        "--phoneme",
+        action="append",
+        help="phoneme to extract, as NAME=TEXT or TEXT (repeatable). "
+        "Without --phoneme and --word, the pauses (empty=) and e=ə are extracted",
+    )
+    parser.add_argument(
+        "--word",
+        action="append",
+        help="word to extract, as NAME=TEXT or TEXT, empty= for the pauses (repeatable)",
+    )
+    args = parser.parse_args()
+    main(
+        args.corpus_dir,
+        workers=args.workers,
+        segment_sets=build_segment_sets(args.phoneme, args.word),
+    )
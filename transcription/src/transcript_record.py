@@ -0,0 +1,139 @@
+"""
+This module avoids transcribing the same audio twice. Next to each transcript, a record (e.g. ALS01.csv.json)
+stores the hash of the audio file and a fingerprint of the transcription configuration (Whisper model and version,
+output format). An audio file is only transcribed again if it changed, if the configuration changed or if its
+transcript is missing. The record also stores the size and modification time of the audio file, and the audio is
+only hashed again when they changed.
+
+Transcripts are written to a temporary file which is renamed once complete, so an interrupted job never leaves a
+truncated transcript.
+"""
+
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from importlib import metadata
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def audio_digest(path):
+    """
+    Computes the sha256 hash of the content of an audio file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_fingerprint(**config):
+    """
+    Computes a fingerprint of the transcription configuration, including the
+    installed Whisper version.
+
+    Parameters:
+    config: options that change the transcripts (model, output format...).
+
+    Returns:
+    str: hexadecimal fingerprint.
+    """
+    try:
+        config["whisper"] = metadata.version("openai-whisper")
+    except metadata.PackageNotFoundError:
+        config["whisper"] = None
+    encoded = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def record_path(transcription_file):
+    return f"{transcription_file}.json"
+
+
+def read_record(transcription_file):
+    """
+    Returns the record of a transcript, None if it has no valid record.
+    """
+    try:
+        with open(record_path(transcription_file), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def audio_state(audio_path, record=None):
+    """
+    Returns the hash, the modification time and the size of an audio file. The
+    hash of the record is reused if the size and the modification time of the
+    file did not change since it was recorded.
+    """
+    stat = os.stat(audio_path)
+    state = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if (
+        record is not None
+        and "audio" in record
+        and (record.get("mtime_ns"), record.get("size")) == (stat.st_mtime_ns, stat.st_size)
+    ):
+        state["audio"] = record["audio"]
+    else:
+        state["audio"] = audio_digest(audio_path)
+    return state
+
+
+def needs_transcription(audio_path, transcription_file, fingerprint, states=None):
+    """
+    Checks if an audio file has no up-to-date transcript.
+
+    Parameters:
+    audio_path (str): path of the audio file.
+    transcription_file (str): path of its transcript.
+    fingerprint (str): fingerprint of the transcription configuration.
+    states (dict): if given, the state of the audio file (see audio_state) is
+        stored in it by path, to be passed to save_record without hashing the
+        file again.
+    """
+    record = read_record(transcription_file) if os.path.exists(transcription_file) else None
+    state = audio_state(audio_path, record)
+    if states is not None:
+        states[audio_path] = state
+    if (
+        record is None
+        or record.get("fingerprint") != fingerprint
+        or record.get("audio") != state["audio"]
+    ):
+        return True
+    if "mtime_ns" not in record:
+        # record written before the size and modification time were stored
+        save_record(audio_path, transcription_file, fingerprint, state)
+    return False
+
+
+@contextmanager
+def atomic_open(path, encoding="utf-8"):
+    """
+    Opens a temporary file that replaces path once it is closed without
+    error. If an error occurs, path is left unchanged.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_record(audio_path, transcription_file, fingerprint, state=None):
+    """
+    Records that the transcript of an audio file is complete. Must be called
+    after the transcript is written. state is the audio_state of the file
+    computed before its transcription, computed here if None.
+    """
+    if state is None:
+        state = audio_state(audio_path)
+    record = dict(state, fingerprint=fingerprint)
+    with atomic_open(record_path(transcription_file)) as f:
+        json.dump(record, f)
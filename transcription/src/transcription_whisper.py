@@ -1,30 +1,89 @@
-import sys
 import glob
-import whisper
+import argparse
+from functools import partial
+from whisper_service import DEFAULT_MODEL, transcribe_corpus
+from transcript_record import (
+    atomic_open,
+    config_fingerprint,
+    needs_transcription,
+    save_record,
+)
 
 
-def get_transcription_from_audio(video_path, data_dir):
+def get_transcription_file(video_path, data_dir):
+    video_id = video_path.split("/")[-1].split(".")[0]
+    return f"{data_dir}../transcripts/{video_id}.txt"
+
+
+def write_transcription(video_path, captions, data_dir, fingerprint, audio_states=None):
     """
-    Generates captions from audio of a given video using the Whisper library.
+    Writes the captions generated from the audio of a given video by the
+    Whisper library, and records that the transcript is complete, with the
+    state of the audio file in audio_states if it was already computed.
     Returns:
     None
     """
-    model = whisper.load_model("large-v2")
-    video_id = video_path.split("/")[-1].split(".")[0]
-    transcription_file = f"{data_dir}../transcripts/{video_id}.txt"
-    captions = model.transcribe(video_path)
-    with open(transcription_file, "w", encoding="utf-8") as f:
+    transcription_file = get_transcription_file(video_path, data_dir)
+    with atomic_open(transcription_file) as f:
         for segment in captions["segments"]:
             f.write(f"{segment['text']}\n")
+    state = audio_states.get(video_path) if audio_states else None
+    save_record(video_path, transcription_file, fingerprint, state)
 
 
-def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python3 transcription_wtimestamps.py /path/to/corpus")
-    audio_files = glob.glob(f"{sys.argv[1]}/*.wav")
-    for audio_path in audio_files:
-        get_transcription_from_audio(audio_path, sys.argv[1])
+def main(corpus_dir, model_name=DEFAULT_MODEL, threads=None, workers=1, force=False):
+    audio_files = glob.glob(f"{corpus_dir}/*.wav")
+    fingerprint = config_fingerprint(model=model_name, output="txt")
+    # Skip the audio files already transcribed with the same configuration.
+    # The audio files are hashed at most once, and not at all if unchanged.
+    audio_states = {}
+    if not force:
+        audio_files = [
+            audio_path
+            for audio_path in audio_files
+            if needs_transcription(
+                audio_path,
+                get_transcription_file(audio_path, corpus_dir),
+                fingerprint,
+                audio_states,
+            )
+        ]
+    print(f"{len(audio_files)} files to transcribe")
+    # The model is loaded once for all the files (once per worker)
+    failed = transcribe_corpus(
+        audio_files,
+        partial(
+            write_transcription,
+            data_dir=corpus_dir,
+            fingerprint=fingerprint,
+            audio_states=audio_states,
+        ),
+        model_name=model_name,
+        threads=threads,
+        workers=workers,
+    )
+    if failed:
+        print(f"{len(failed)} files could not be transcribed, they are transcribed again by the next run")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir")
+    parser.add_argument("-m", "--model", default=DEFAULT_MODEL, help="Whisper model")
+    parser.add_argument(
+        "-t", "--threads", type=int, help="number of CPU threads per worker"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="transcribe every file again"
+    )
+    args = parser.parse_args()
+    main(
+        args.corpus_dir,
+        model_name=args.model,
+        threads=args.threads,
+        workers=args.workers,
+        force=args.force,
+    )
@@ -0,0 +1,247 @@
+"""
+This module loads a Whisper model once and uses it to transcribe a list of audio files, instead of loading the
+model again for every file.
+
+With several workers, each worker process keeps its own model in memory and uses its own number of CPU threads.
+The longest files are sent first, so that the run does not end waiting for a long file started last.
+
+With a chunk length, each recording is split at silences into chunks of at most that length, the chunks are
+transcribed in parallel and their segments are put back together with timestamps relative to the whole recording.
+"""
+
+import os
+import numpy as np
+import torch
+import whisper
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+DEFAULT_MODEL = "large-v2"
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+FRAME_LENGTH = 0.03  # seconds, frames used to find the silences
+SEARCH_LENGTH = 10.0  # seconds before the chunk length where a cut is searched
+
+# TranscriptionService owned by the current worker process
+_service = None
+
+
+class TranscriptionService:
+    """
+    Keeps a Whisper model in memory to transcribe audio files.
+
+    Parameters:
+        model_name (str): name of the Whisper model (tiny, base, small, medium,
+            large-v2...).
+        threads (int): number of CPU threads used by torch, None for the torch
+            default.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, threads=None):
+        if threads is not None:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio_path):
+        """
+        Transcribes an audio file.
+
+        Returns:
+        dict: Whisper result, with the text and the timestamped segments.
+        """
+        return self.model.transcribe(audio_path)
+
+    def transcribe_chunk(self, audio, offset):
+        """
+        Transcribes a chunk of a recording.
+
+        Parameters:
+        audio (np.ndarray): samples of the chunk at 16 kHz.
+        offset (float): start of the chunk in the recording, in seconds.
+
+        Returns:
+        dict: Whisper result, with timestamps relative to the recording.
+        """
+        result = self.model.transcribe(audio)
+        for segment in result["segments"]:
+            segment["start"] += offset
+            segment["end"] += offset
+        return result
+
+    def transcribe_all(self, audio_files, write_transcription):
+        """
+        Transcribes the audio files one after the other with the same model.
+
+        Parameters:
+        audio_files (list): paths of the audio files.
+        write_transcription (function): called with the path of each audio file
+            and its Whisper result.
+        """
+        for audio_path in tqdm(audio_files):
+            write_transcription(audio_path, self.transcribe(audio_path))
+
+
+def split_on_silences(audio, chunk_length, search_length=SEARCH_LENGTH):
+    """
+    Splits a recording into chunks of at most chunk_length seconds. Each cut
+    is made at the quietest frame of the search_length seconds before the
+    maximum length of the chunk.
+
+    Parameters:
+    audio (np.ndarray): samples of the recording at 16 kHz.
+    chunk_length (float): maximum length of a chunk in seconds.
+    search_length (float): length of the window where a cut is searched.
+
+    Returns:
+    list: (start, end) sample indices of each chunk.
+    """
+    max_samples = int(chunk_length * SAMPLE_RATE)
+    if max_samples < 1:
+        raise ValueError(f"chunk_length must be positive, got {chunk_length}")
+    frame = int(FRAME_LENGTH * SAMPLE_RATE)
+    n_frames = len(audio) // frame
+    energy = np.sqrt(np.mean(audio[: n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    cuts = [0]
+    while len(audio) - cuts[-1] > max_samples:
+        window_end = cuts[-1] + max_samples
+        window_start = max(cuts[-1] + 1, window_end - int(search_length * SAMPLE_RATE))
+        first, last = -(-window_start // frame), window_end // frame
+        if last <= first:
+            cut = window_end
+        else:
+            quietest = first + int(np.argmin(energy[first:last]))
+            cut = quietest * frame + frame // 2
+        # every chunk has at least one sample
+        cuts.append(max(cut, cuts[-1] + 1))
+    cuts.append(len(audio))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def merge_chunks(results):
+    """
+    Puts back together the Whisper results of the chunks of a recording, in
+    the order of the chunks.
+    """
+    segments = [segment for result in results for segment in result["segments"]]
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    return {
+        "text": "".join(result["text"] for result in results),
+        "segments": segments,
+    }
+
+
+def init_worker(model_name, threads):
+    global _service
+    _service = TranscriptionService(model_name, threads)
+
+
+def transcribe_in_worker(audio_path):
+    return audio_path, _service.transcribe(audio_path)
+
+
+def transcribe_chunk_in_worker(audio, offset):
+    return _service.transcribe_chunk(audio, offset)
+
+
+def load_chunks(audio_path, chunk_length):
+    """
+    Yields the chunks of a recording with their offset in seconds.
+    """
+    audio = whisper.load_audio(audio_path)
+    for start, end in split_on_silences(audio, chunk_length):
+        yield audio[start:end], start / SAMPLE_RATE
+
+
+def transcribe_corpus(
+    audio_files,
+    write_transcription,
+    model_name=DEFAULT_MODEL,
+    threads=None,
+    workers=1,
+    chunk_length=None,
+):
+    """
+    Transcribes audio files with one model, or with a pool of worker processes
+    that each load the model once.
+
+    Parameters:
+    audio_files (list): paths of the audio files.
+    write_transcription (function): called in the main process with the path
+        of each audio file and its Whisper result.
+    model_name (str): name of the Whisper model.
+    threads (int): number of CPU threads of each model. With several workers,
+        the CPU cores are divided between them by default.
+    workers (int): number of worker processes, 1 runs in the current process.
+    chunk_length (float): if given, each file is split at silences into chunks
+        of at most chunk_length seconds, transcribed in parallel.
+
+    Returns:
+    list: paths of the audio files that could not be transcribed. A failed
+    file is reported and the other files are still transcribed.
+    """
+    failed = []
+
+    def report(audio_path, error):
+        print(f"\nERROR: could not transcribe {audio_path}: {error!r}")
+        failed.append(audio_path)
+
+    if workers <= 1:
+        service = TranscriptionService(model_name, threads)
+        for audio_path in tqdm(audio_files):
+            try:
+                if chunk_length is None:
+                    result = service.transcribe(audio_path)
+                else:
+                    result = merge_chunks(
+                        [
+                            service.transcribe_chunk(audio, offset)
+                            for audio, offset in load_chunks(audio_path, chunk_length)
+                        ]
+                    )
+            except Exception as error:
+                report(audio_path, error)
+                continue
+            write_transcription(audio_path, result)
+        return failed
+    if threads is None:
+        # share the cores between the workers instead of each using all of them
+        threads = max(1, os.cpu_count() // workers)
+    # Longest files first (the size of a WAV file grows with its duration)
+    audio_files = sorted(audio_files, key=os.path.getsize, reverse=True)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(model_name, threads),
+    ) as pool:
+        try:
+            if chunk_length is not None:
+                for audio_path in tqdm(audio_files):
+                    futures = []
+                    try:
+                        for audio, offset in load_chunks(audio_path, chunk_length):
+                            futures.append(pool.submit(transcribe_chunk_in_worker, audio, offset))
+                        results = [future.result() for future in futures]
+                    except Exception as error:
+                        for future in futures:
+                            future.cancel()
+                        report(audio_path, error)
+                        continue
+                    write_transcription(audio_path, merge_chunks(results))
+                return failed
+            futures = {
+                pool.submit(transcribe_in_worker, audio_path): audio_path
+                for audio_path in audio_files
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    audio_path, result = future.result()
+                except Exception as error:
+                    report(futures[future], error)
+                    continue
+                write_transcription(audio_path, result)
+            return failed
+        except BaseException:
+            # do not wait for the queued files when the run is stopped
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise